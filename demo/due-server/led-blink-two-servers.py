@@ -0,0 +1,20 @@
+"""
+Blink the on-board LEDs (pin d13) of two servers,
+a Due on COM3 and another Due on COM4
+"""
+
+import sys
+sys.path.append( "../.." )
+import hwpy
+
+import time
+led_a = hwpy.gpo( hwpy.arduino.d13, server = "COM3" )
+led_b = hwpy.gpo( hwpy.arduino.d13, server = "COM4" )
+print( __doc__ )
+while True:
+   led_a.write( 0 )
+   led_b.write( 1 )
+   time.sleep( 0.2 )
+   led_a.write( 1 )
+   led_b.write( 0 )
+   time.sleep( 0.2 )
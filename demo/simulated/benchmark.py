@@ -0,0 +1,68 @@
+"""
+Benchmark port, keypad, hd44780 and bit-banged i2c
+on a simulated GPIO server (no hardware needed).
+
+Run with the environment variable HWPY_GPIO=simulated.
+The serial link to the server is modelled as 115k2 baud
+with 1 ms latency, like a Due on a USB port.
+"""
+
+import sys, time
+sys.path.append( "../.." )
+import hwpy
+
+server = hwpy.simulated_server( "sim", baudrate = 115200, latency = 0.001 )
+link = server._serial_port
+
+def benchmark( name, n, f ):
+   link.bytes_written = 0
+   start = time.perf_counter()
+   for i in range( 0, n ):
+      f( i )
+   t = ( time.perf_counter() - start ) / n
+   print( "%-20s %10.1f us %8.1f bytes" % (
+      name, t * 1e6, 1.0 * link.bytes_written / n ))
+
+print( __doc__ )
+
+leds = hwpy.port([
+   hwpy.gpo( pin, server = "sim" ) for pin in [
+      hwpy.arduino.d2, hwpy.arduino.d3, hwpy.arduino.d4, hwpy.arduino.d5,
+      hwpy.arduino.d6, hwpy.arduino.d7, hwpy.arduino.d8, hwpy.arduino.d9 ]])
+benchmark( "port write", 100, lambda i: leds.write( i ))
+
+switches = hwpy.port([
+   hwpy.gpi( pin, server = "sim" ) for pin in [
+      hwpy.arduino.a0, hwpy.arduino.a1, hwpy.arduino.a2, hwpy.arduino.a3 ]])
+benchmark( "port read", 100, lambda i: switches.read())
+
+keypad = hwpy.keypad(
+   hwpy.port([
+      hwpy.gpoc( pin, server = "sim" ) for pin in [
+         hwpy.arduino.a4, hwpy.arduino.a5, hwpy.arduino.a6, hwpy.arduino.a7 ]]),
+   switches,
+   "147*2580369#ABCD" )
+benchmark( "keypad scan", 10, lambda i: keypad.read_pressed_nonblocking( None ))
+
+lcd = hwpy.hd44780(
+   hwpy.gpo( hwpy.arduino.d10, server = "sim" ),
+   hwpy.gpo( hwpy.arduino.d11, server = "sim" ),
+   hwpy.port([
+      hwpy.gpo( pin, server = "sim" ) for pin in [
+         hwpy.arduino.d12, hwpy.arduino.d13, hwpy.arduino.d14, hwpy.arduino.d15 ]]),
+   hwpy.xy( 16, 2 ))
+benchmark( "hd44780 line", 10, lambda i: lcd.write( "\rHello world %4d" % i ))
+
+lcd = hwpy.hd44780.from_transport( lcd._transport, hwpy.xy( 16, 2 ), buffered = True )
+def lcd_buffered( i ):
+   lcd.write( "\rHello world %4d" % i )
+   lcd.flush()
+benchmark( "hd44780 buffered", 10, lcd_buffered )
+
+i2c = hwpy.i2c_from_scl_sda(
+   hwpy.gpoc( hwpy.arduino.d16, server = "sim" ),
+   hwpy.gpoc( hwpy.arduino.d17, server = "sim" ))
+benchmark( "i2c 2-byte write", 10, lambda i: i2c.write( 0x20, [ i, i ] ))
+
+lcd = hwpy.hd44780.from_pcf8574( hwpy.pcf8574( i2c, 7 ), hwpy.xy( 16, 2 ))
+benchmark( "hd44780 pcf8574", 10, lambda i: lcd.write( "\rHello world %4d" % i ))
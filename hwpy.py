@@ -22,6 +22,8 @@ For the Pi http://domoticx.com/python-library-rpi-gpio/ is used
 
 For use with a server PySerial must be installed:
      python -m pip install pyserial
+For the asyncio server interface pyserial-asyncio must be installed:
+     python -m pip install pyserial-asyncio
 
 ToDo & wish list
 - card reader?
@@ -42,8 +44,7 @@ ToDo & wish list
 
 import os
 
-from extern/bitstring.bitstring import *
-from extern/adafruit/.platform import *
+from hwpy_extern.adafruit.platform import *
 
 from hwpy_modules.wait import *
 from hwpy_modules.xy import *
@@ -56,6 +57,7 @@ from hwpy_modules.keypad import *
 from hwpy_modules.demos import *
 from hwpy_modules.sr04 import *
 from hwpy_modules.i2c_bb import *
+from hwpy_modules.i2c_scheduler import *
 from hwpy_modules.i2c_registers import *
 from hwpy_modules.pcf8574 import *
 from hwpy_modules.pcf8591 import *
@@ -69,3 +71,5 @@ if os.uname().machine != 'x86_64':
    from hwpy_modules.i2c_rapi import *
    from hwpy_modules.spi_rapi import *
    from hwpy_modules.neopixels_rapi import *
+else:
+   from hwpy_modules.gpio_remote_async import *
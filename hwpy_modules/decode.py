@@ -0,0 +1,75 @@
+"""
+decoding of register values
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+import struct
+
+def unsigned(data, offset: int = 0, size: int = 2, big_endian: bool = True) -> int:
+    """Decode an unsigned field of size bytes at the offset in the data.
+
+    The data can be bytes, a bytearray or a list of byte values
+    (as returned by an i2c read).
+    Register values are commonly big-endian (high byte first).
+    """
+    return int.from_bytes(
+        bytes(data[offset : offset + size]),
+        'big' if big_endian else 'little')
+
+def signed(data, offset: int = 0, size: int = 2, big_endian: bool = True) -> int:
+    """Decode a (two's complement) signed field of size bytes at the offset.
+    """
+    return int.from_bytes(
+        bytes(data[offset : offset + size]),
+        'big' if big_endian else 'little',
+        signed = True)
+
+_formats = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+_structs = {}
+
+def _struct(n: int, size: int, is_signed: bool, big_endian: bool) -> struct.Struct:
+    key = (n, size, is_signed, big_endian)
+    s = _structs.get(key)
+    if s == None:
+        f = _formats[size]
+        s = struct.Struct(
+            ('>' if big_endian else '<') + str(n)
+            + (f if is_signed else f.upper()))
+        _structs[key] = s
+    return s
+
+def block(
+    data,
+    size: int = 2,
+    is_signed: bool = True,
+    big_endian: bool = True,
+    numpy: bool = False
+):
+    """Decode a block of consecutive fields of size (1, 2, 4 or 8) bytes.
+
+    This is used to decode a block of registers that is read in one
+    transaction, like the x, y and z readings of a sensor.
+    The result is a tuple of ints, or, when numpy is True,
+    a numpy array (which requires numpy).
+    Any bytes after the last whole field are ignored.
+    """
+    data = bytes(data)
+    n = len(data) // size
+    if numpy:
+        try:
+            import numpy
+        except ImportError:
+            print(
+                "To decode to numpy arrays, you need numpy,"
+                "install it with \"python -m pip install numpy\"." )
+            print("Exiting...")
+            exit()
+        return numpy.frombuffer(
+            data,
+            dtype = ('>' if big_endian else '<')
+                + ('i' if is_signed else 'u') + str(size),
+            count = n)
+    return _struct(n, size, is_signed, big_endian).unpack_from(data)
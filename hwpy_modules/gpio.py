@@ -8,7 +8,23 @@ home: https://www.github.com/wovo/hwpy
 
 import os
 
-if os.uname().machine == 'x86_64':
+# the gpio implementation can be selected by setting HWPY_GPIO to
+#    remote    : a gpio server (default on a PC)
+#    rapi      : the Raspberry Pi gpio (default on anything else)
+#    gpiomem   : the Raspberry Pi gpio registers, via /dev/gpiomem
+#    simulated : a simulated gpio server, for tests and benchmarks
+_gpio_implementation = os.environ.get(
+    'HWPY_GPIO',
+    'remote' if os.uname().machine == 'x86_64' else 'rapi' )
+
+if _gpio_implementation == 'simulated':
+    from hwpy_modules.gpio_simulated import *
+    simulated_server()
+    print( "using simulated gpio" )
+elif _gpio_implementation == 'gpiomem':
+    from hwpy_modules.gpio_rapi_mem import *
+    print( "using local gpio registers" )
+elif _gpio_implementation == 'remote':
     from hwpy_modules.gpio_remote import *
     print( "using remote gpio" )
 else:
@@ -19,11 +35,14 @@ class gpi:
     """A gpi (input only) pin (with pull-up).
     """
 
-    def __init__(self, pin: int, pullup: bool = True, pulldown: bool = False):
+    def __init__(self, pin: int, pullup: bool = True, pulldown: bool = False, **kwargs):
         """Create a gpi pin from its (BCM or Arduino) pin number.
+
+        Additional keyword arguments are passed to the gpio,
+        for a remote gpio this can be the server.
         """
 
-        self._pin = gpio(pin)
+        self._pin = gpio(pin, **kwargs)
         self._pin.make_input(pullup, pulldown)
 
     def read(self) -> bool:
@@ -32,16 +51,28 @@ class gpi:
 
         return self._pin.read()
 
+    def on_falling_edge(self, callback):
+        """Call callback() on each falling edge of the pin.
+
+        This is only supported by some gpio implementations
+        (Raspberry Pi RPi.GPIO), others raise AttributeError.
+        """
+
+        self._pin.on_falling_edge(callback)
+
 
 class gpo:
     """A gpo (output only) pin.
     """
 
-    def __init__(self, pin: int):
+    def __init__(self, pin: int, **kwargs):
         """Create a gpo pin from its (BCM or Arduino) pin number.
+
+        Additional keyword arguments are passed to the gpio,
+        for a remote gpio this can be the server.
         """
 
-        self._pin = gpio(pin)
+        self._pin = gpio(pin, **kwargs)
         self._pin.make_output()
 
     def write(self, v: int):
@@ -55,11 +86,14 @@ class gpoc:
    """A gpoc (open-collector input output) pin.
    """
 
-   def __init__( self, pin ):
+   def __init__( self, pin, **kwargs ):
       """Create a gpoc pin from its (BCM or Arduino) pin number.
+
+      Additional keyword arguments are passed to the gpio,
+      for a remote gpio this can be the server.
       """
 
-      self._pin = gpio( pin )
+      self._pin = gpio( pin, **kwargs )
       self._pin.make_input()
 
    def write( self, v ):
@@ -6,6 +6,93 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
+import contextlib, time
+
+class buffered_master:
+    """A chip that provides buffered GPIO pins.
+
+    A buffered master has a _write_buffer that is written to the chip
+    by _flush(), and a _read_buffer that is read from the chip
+    by _refresh(). A concrete master must implement these two.
+
+    Normally each change of the write_buffer is flushed immediately.
+    Within a batch() the changes are only collected in the
+    write_buffer, and flushed once when the (outermost) batch ends:
+
+       with chip.batch():
+          chip.p0.write( 1 )
+          chip.p1.write( 0 )
+
+    When flush_on_read is True, changes are never flushed immediately,
+    but only by flush() or before the next read from the chip.
+
+    The refresh_us attribute sets when a read refreshes the read_buffer:
+       - 0 (default): every read refreshes it
+       - N: reads within N microseconds after a refresh share that
+         snapshot (a write to the chip makes the snapshot stale)
+       - None: only an explicit refresh() (or the first read) does it
+    """
+
+    def __init__(self):
+        """Initialize the buffers and the batching state.
+        """
+        self._read_buffer = 0
+        self._write_buffer = 0
+        self._batch_depth = 0
+        self._dirty = False
+        self.flush_on_read = False
+        self.refresh_us = 0
+        self._refreshed_ns = None
+
+    def _written(self):
+        """The write_buffer has been changed: flush it, or mark it dirty.
+        """
+        self._dirty = True
+        if self._batch_depth == 0 and not self.flush_on_read:
+            self.flush()
+
+    def _reading(self):
+        """The read_buffer is needed: flush pending writes, and refresh
+        it when the refresh policy (refresh_us) requires it.
+        """
+        self.flush()
+        if self._refreshed_ns == None:
+            self.refresh()
+        elif self.refresh_us == None:
+            pass
+        elif ( time.perf_counter_ns() - self._refreshed_ns
+                >= self.refresh_us * 1000 ):
+            self.refresh()
+
+    def flush(self):
+        """Flush the write_buffer to the chip, if it has pending changes.
+        """
+        if self._dirty:
+            self._dirty = False
+            self._flush()
+
+            # the write can change what is read from the chip
+            if self.refresh_us != None:
+                self._refreshed_ns = None
+
+    def refresh(self):
+        """Refresh the read_buffer from the chip.
+        """
+        self._refresh()
+        self._refreshed_ns = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Context manager that collects all writes into one flush.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
 class buffered_pin:
     """A buffered GPIO pin.
 
@@ -17,7 +104,7 @@ class buffered_pin:
     74HC594 or a PCF8574.
     """
 
-    def __init__(self, master, nr: int):
+    def __init__(self, master: buffered_master, nr: int):
         """Create a buffered pin from its master and it bit number.
         """
         self._master = master
@@ -28,20 +115,21 @@ class buffered_pin:
 
         The bit value v is put in the master.write_buffer at the
         bit position nr (as specified to the constructor)
-        and master.flush() is called.
+        and the master flushes it (or, in a batch, marks it dirty).
         """
         if v:
             self._master._write_buffer |= self._mask
         else:
             self._master._write_buffer &= ~ self._mask
-        self._master._flush()
+        self._master._written()
 
     def read(self) -> bool:
         """Read the bit via the master and return it.
 
-        The master.refresh() is called and the bit at position nr
+        The master.read_buffer is refreshed (after flushing any
+        pending writes) and the bit at position nr
         (as specified to the constructor) from the master.read_buffer
         is returned.
         """
-        self._master._refresh()
+        self._master._reading()
         return (self._master._read_buffer & self._mask) != 0
\ No newline at end of file
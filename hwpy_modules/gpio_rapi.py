@@ -62,4 +62,71 @@ class _rapi_gpio:
         """
         return True if self.GPIO.input( self._pin ) else False        
 
+    def on_falling_edge( self, callback ):
+        """Call callback() (from another thread) on each falling edge.
+
+        Note: the pin must be an input.
+        """
+        self.GPIO.add_event_detect(
+            self._pin,
+            self.GPIO.FALLING,
+            callback = lambda channel: callback() )
+
+    def _port( self, gpios: list ):
+        """Return a _rapi_port for the gpios, or None.
+
+        This is possible when all gpios are _rapi_gpio pins.
+        """
+        for g in gpios:
+            if not isinstance( g, _rapi_gpio ):
+                return None
+        return _rapi_port( gpios )
+
+    def _oc_sequencer( self, sda: '_rapi_gpio' ):
+        """Return an open-collector sequencer for this (scl) and sda, or None.
+
+        RPi.GPIO has no call that replays a sequence of levels,
+        so the sequencer uses the gpio registers (/dev/gpiomem).
+        None is returned when those are not accessible.
+        """
+        if not isinstance( sda, _rapi_gpio ):
+            return None
+        import hwpy_modules.gpio_rapi_mem
+        try:
+            registers = hwpy_modules.gpio_rapi_mem.gpiomem()
+        except OSError:
+            return None
+        return hwpy_modules.gpio_rapi_mem._rapi_mem_oc_sequencer(
+            registers, self._pin, sda._pin )
+
+
+class _rapi_port:
+    """A set of Raspberry Pi gpio pins.
+
+    A write is one call to the list form of RPi.GPIO output(),
+    a read calls RPi.GPIO input() directly for each pin.
+    Bit 0 of a value corresponds to the first gpio, etc.
+    """
+
+    def __init__( self, gpios: list ):
+        self.GPIO = gpios[ 0 ].GPIO
+        self._pins = [ g._pin for g in gpios ]
+        self._bits = [ 1 << i for i in range( 0, len( gpios ) ) ]
+
+    def write( self, v: int ):
+        """Write the bits of v to the pins.
+        """
+        self.GPIO.output(
+            self._pins,
+            [ 1 if v & bit else 0 for bit in self._bits ] )
+
+    def read( self ) -> int:
+        """Read and return the pins as the bits of an int.
+        """
+        result = 0
+        for pin, bit in zip( self._pins, self._bits ):
+            if self.GPIO.input( pin ):
+                result |= bit
+        return result
+
 gpio = _rapi_gpio
\ No newline at end of file
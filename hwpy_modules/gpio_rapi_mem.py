@@ -0,0 +1,269 @@
+"""
+Raspberry Pi memory-mapped (/dev/gpiomem) gpio implementation
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+import os, mmap, struct, time
+
+from hwpy_modules.pin_word import _pin_word
+
+class _gpiomem:
+    """The memory-mapped gpio registers of a Raspberry Pi.
+
+    The gpio register block is accessed by mapping /dev/gpiomem,
+    which doesn't require root access.
+    A regular file can stand in for the register block (for tests),
+    it must be at least 4096 bytes.
+    Only the pins 0..31 (bank 0) are supported.
+    """
+
+    # register offsets
+    GPFSEL0 = 0x00
+    GPSET0 = 0x1C
+    GPCLR0 = 0x28
+    GPLEV0 = 0x34
+    GPPUD = 0x94
+    GPPUDCLK0 = 0x98
+    GPPUPPDN0 = 0xE4
+    GPPUPPDN3 = 0xF0
+
+    # function select values
+    INPUT = 0
+    OUTPUT = 1
+
+    def __init__( self, path: str = "/dev/gpiomem" ):
+        """Map the gpio register block.
+        """
+        fd = os.open( path, os.O_RDWR | os.O_SYNC )
+        try:
+            self._mem = mmap.mmap( fd, 4096, mmap.MAP_SHARED,
+                mmap.PROT_READ | mmap.PROT_WRITE )
+        finally:
+            os.close( fd )
+
+        # a BCM2711 (Pi 4) has the pull-up/down control registers,
+        # on older chips this location reads as 'gpio'
+        self._is_2711 = self._get( self.GPPUPPDN3 ) != 0x6770696f
+
+    def _get( self, offset: int ) -> int:
+        return struct.unpack_from( '<I', self._mem, offset )[ 0 ]
+
+    def _set( self, offset: int, value: int ):
+        struct.pack_into( '<I', self._mem, offset, value )
+
+    def set_function( self, pin: int, f: int ):
+        """Set the function (INPUT or OUTPUT) of a pin.
+        """
+        offset = self.GPFSEL0 + 4 * ( pin // 10 )
+        shift = 3 * ( pin % 10 )
+        self._set(
+            offset,
+            ( self._get( offset ) & ~ ( 0x7 << shift )) | ( f << shift ))
+
+    def set_pull( self, pin: int, pullup: bool, pulldown: bool ):
+        """Set the pull-up or pull-down of a pin.
+        """
+        if self._is_2711:
+            offset = self.GPPUPPDN0 + 4 * ( pin // 16 )
+            shift = 2 * ( pin % 16 )
+            mode = 2 if pulldown else 1 if pullup else 0
+            self._set(
+                offset,
+                ( self._get( offset ) & ~ ( 0x3 << shift )) | ( mode << shift ))
+        else:
+            # BCM2835 sequence: set the control, clock it into the pin
+            self._set( self.GPPUD, 1 if pulldown else 2 if pullup else 0 )
+            time.sleep( 0.00001 )
+            self._set( self.GPPUDCLK0, 1 << pin )
+            time.sleep( 0.00001 )
+            self._set( self.GPPUD, 0 )
+            self._set( self.GPPUDCLK0, 0 )
+
+    def set( self, mask: int ):
+        """Make the output pins in the mask high, in one store.
+        """
+        self._set( self.GPSET0, mask )
+
+    def clear( self, mask: int ):
+        """Make the output pins in the mask low, in one store.
+        """
+        self._set( self.GPCLR0, mask )
+
+    def levels( self ) -> int:
+        """Return the levels of all pins, in one load.
+        """
+        return self._get( self.GPLEV0 )
+
+_gpiomems = {}
+
+def gpiomem( path: str = "/dev/gpiomem" ) -> _gpiomem:
+    """Return the (shared) mapping of the gpio registers.
+    """
+    if not path in _gpiomems:
+        _gpiomems[ path ] = _gpiomem( path )
+    return _gpiomems[ path ]
+
+
+class _rapi_mem_gpio:
+    """A Raspberry Pi gpio (input and output) pin, via /dev/gpiomem.
+
+    This has the same interface as the RPi.GPIO based gpio,
+    but accesses the gpio registers directly.
+    The pins of a port that are all _rapi_mem_gpio pins are
+    written with one store (per level) and read with one load.
+    """
+
+    def __init__( self, pin: int, registers: _gpiomem = None ):
+        """Create a gpio pin from its pin (BCM) number.
+
+        By default the registers are the (shared) /dev/gpiomem mapping.
+        """
+        self._gpiomem = gpiomem() if registers == None else registers
+        self._pin = pin
+        self._mask = 1 << pin
+        self._gpiomem.set_function( self._pin, _gpiomem.OUTPUT )
+
+    def make_input( self, pullup: bool = True, pulldown: bool = False ):
+        """Make the gpio an input, by default, the pullup is enabled
+        """
+        self._gpiomem.set_function( self._pin, _gpiomem.INPUT )
+        self._gpiomem.set_pull( self._pin, pullup, pulldown )
+
+    def make_output( self ):
+        """Make the gpio an output.
+        """
+        self._gpiomem.set_function( self._pin, _gpiomem.OUTPUT )
+
+    def write( self, v ):
+        """Write v (evaluated as boolean) to the gpio.
+
+        Note: the pin must be an output.
+        """
+        if v:
+            self._gpiomem.set( self._mask )
+        else:
+            self._gpiomem.clear( self._mask )
+
+    def read( self ) -> bool:
+        """Read and return the value (boolean) of the gpio.
+
+        Note: the pin must be an input.
+        """
+        return ( self._gpiomem.levels() & self._mask ) != 0
+
+    def _port( self, gpios: list ):
+        """Return a _rapi_mem_port for the gpios, or None.
+
+        This is possible when all gpios use the same registers.
+        """
+        for g in gpios:
+            if not isinstance( g, _rapi_mem_gpio ) or g._gpiomem != self._gpiomem:
+                return None
+        return _rapi_mem_port( gpios )
+
+    def _oc_sequencer( self, sda: '_rapi_mem_gpio' ):
+        """Return a _rapi_mem_oc_sequencer for this (scl) and sda, or None.
+
+        This is possible when both gpios use the same registers.
+        """
+        if not isinstance( sda, _rapi_mem_gpio ) or sda._gpiomem != self._gpiomem:
+            return None
+        return _rapi_mem_oc_sequencer( self._gpiomem, self._pin, sda._pin )
+
+
+class _rapi_mem_port:
+    """A set of Raspberry Pi gpio pins, via /dev/gpiomem.
+
+    A write is one store to the set register and one to the
+    clear register, a read is one load from the level register.
+    Bit 0 of a value corresponds to the first gpio, etc.
+    """
+
+    def __init__( self, gpios: list ):
+        self._gpiomem = gpios[ 0 ]._gpiomem
+        self._word = _pin_word( [ g._pin for g in gpios ] )
+
+    def write( self, v: int ):
+        """Write the bits of v to the pins.
+        """
+        word = self._word.word( v )
+        self._gpiomem.set( word )
+        self._gpiomem.clear( ~ word & self._word.mask )
+
+    def read( self ) -> int:
+        """Read and return the pins as the bits of an int.
+        """
+        return self._word.value( self._gpiomem.levels() )
+
+class _rapi_mem_oc_sequencer:
+    """Replays a sequence of open-collector scl and sda levels.
+
+    This is used by the bit-banged i2c: a whole transaction
+    is replayed in one call, directly on the gpio registers.
+    The output latches of both pins are kept low, a line is pulled
+    low by making it an output, and released by making it an input.
+    """
+
+    def __init__( self, registers: _gpiomem, scl: int, sda: int ):
+        self._gpiomem = registers
+        self._scl = scl
+        self._sda = sda
+        self._scl_mask = 1 << scl
+        self._sda_mask = 1 << sda
+        registers.clear( self._scl_mask | self._sda_mask )
+
+    def run(
+        self,
+        steps: list,
+        half_bit_ns: int = 0,
+        stretch_timeout_ns: int = None
+    ) -> list:
+        """Replay the ( scl, sda, sample ) steps, return the samples.
+
+        Each line change is done at least half_bit_ns after the
+        previous one (busy-waiting on time.perf_counter_ns).
+        After each release of scl, this waits while scl is low
+        (clock stretching by a slave), but at most stretch_timeout_ns
+        (None: no limit): then TimeoutError is raised.
+        """
+        registers = self._gpiomem
+        set_function = registers.set_function
+        levels = registers.levels
+        clock = time.perf_counter_ns
+        scl_pin, sda_pin = self._scl, self._sda
+        scl_mask, sda_mask = self._scl_mask, self._sda_mask
+        samples = []
+        scl, sda = 1, 1
+        edge = 0
+        for s_scl, s_sda, sample in steps:
+            if s_scl != scl:
+                scl = s_scl
+                if half_bit_ns:
+                    while clock() < edge + half_bit_ns:
+                        pass
+                    edge = clock()
+                set_function(
+                    scl_pin, _gpiomem.INPUT if scl else _gpiomem.OUTPUT )
+                if scl and not levels() & scl_mask:
+                    start = clock()
+                    while not levels() & scl_mask:
+                        if ( stretch_timeout_ns != None
+                            and clock() - start > stretch_timeout_ns
+                        ):
+                            raise TimeoutError
+            if s_sda != sda:
+                sda = s_sda
+                if half_bit_ns:
+                    while clock() < edge + half_bit_ns:
+                        pass
+                    edge = clock()
+                set_function(
+                    sda_pin, _gpiomem.INPUT if sda else _gpiomem.OUTPUT )
+            if sample:
+                samples.append( ( levels() & sda_mask ) != 0 )
+        return samples
+
+gpio = _rapi_mem_gpio
@@ -6,7 +6,9 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
-import time, enum
+import time, enum, contextlib, collections
+
+from hwpy_modules.pin_word import _pin_word
 
 class pins( enum.Enum ):
    pass
@@ -68,148 +70,504 @@ class _commands( enum.Enum ):
    high    = 2
    low     = 3
    read    = 4
+   read_port  = 5
+   write_port = 6
+   hello      = 7
+
+# the response of a server to a hello command
+_hello_response = b'hwpy'
 
-_serial_port = None
 _serial_port_name = "COM3"
 _serial_port_baudrate = 115200
 
+# time (in seconds) to wait for a response from a server
+_serial_port_timeout = 0.5
+
+# time (in seconds) to wait for a server to answer a hello:
+# when it is already running, and after a reset
+_hello_timeout = 0.05
+_startup_timeout = 3.0
+
 #_serial_port_name = "COM4"
 #_serial_port_baudrate = 115200
 
-class _server_gpio:
-    """A remote GPIO pin on a server.
+class _server:
+    """A connection to a GPIO server.
 
-    This is a GPIO pin that is provided by a GPIO server.
-    It is used via serial connection.
+    The connection owns the serial port to the server and a
+    write queue for the (silent) pin commands.
+    Normally each command is sent immediately.
+    When batching is enabled, commands are queued and sent in one
+    serial write when flush() is called, or when the response
+    to a read is needed.
+    Read requests are pipelined: the responses are collected,
+    in order, only when they are needed.
 
     To use this class, you must install PySerial:
        python -m pip install pyserial
-    """        
-    
+    """
+
     _debug_log = False
-    
-    def __init__( self, nr : pins ):
-      # d0 and d1 are claimed for the communication
-      self.pin = nr.value - 2 
-      
-      global _serial_port
-      if _serial_port == None:
-         try:
-             import serial
-         except ImportError:
-             print(
-                "To use Host GPIO, you need the pyserial module," 
-                "install it with \"python -m pip install pyserial\"." )
-             print("Exiting...")
-             exit()
-         try:    
-            _serial_port = serial.Serial( 
-               _serial_port_name, 
-               _serial_port_baudrate,
-               timeout = 0,
-               parity=serial.PARITY_NONE           
-                              
-            ) 
-         except serial.serialutil.SerialException:
-             print(
-                "The serial port %s could not be opened. "
-                "You can use the device manager to change the name of "
-                "the port the Arduino server is connected to. " 
-                "An Arduino Due must be disconnected and re-connected "
-                "to effectuate a name change." % _serial_port_name )
-             print("Exiting...")
-             exit()        
-             
-         # reset-and-run sequence for a DB100/DB103 server    
-         _serial_port.setRTS( 0 ) # run mode
-         _serial_port.setDTR( 0 ) # reset
-         time.sleep( 0.1 )
-         _serial_port.setDTR( 0 ) # release reset
-         
-         
-         # openening the port can cause the server to be reset, so
+
+    def __init__( self, name: str, baudrate: int, serial_port = None ):
+      """Open the connection to the server on the named serial port.
+
+      Instead of the named serial port, an (already open) serial
+      port object can be specified, like a simulated server.
+      """
+      self.name = name
+      self.batching = False
+      self._queue = bytearray()
+      self._pending = collections.deque()
+      self._serial_port = serial_port
+      if self._serial_port == None:
+         self._open( name, baudrate )
+
+      # fast path: a server that is already running answers at once
+      if not self._hello( _hello_timeout ):
+         self._reset()
+
          # wait for the server to come to life
-         time.sleep( 2.0 )
-         
-         # read and discard any junk that might be in the input
-         self._empty_serial_input()
-  
+         deadline = time.monotonic() + _startup_timeout
+         while not self._hello( _hello_timeout ):
+            if time.monotonic() > deadline:
+               print(
+                  "The server on %s does not answer a hello, "
+                  "it might be an old server version." % name )
+               break
+
+         # The answer that was received can be that of an earlier hello:
+         # the answers to the last hellos can still be underway.
+         self._drain_serial_input( 2 * _hello_timeout )
+
+      # read and discard any junk that might be in the input
+      self._empty_serial_input()
+
+    def _open( self, name: str, baudrate: int ):
+      try:
+          import serial
+      except ImportError:
+          print(
+             "To use Host GPIO, you need the pyserial module,"
+             "install it with \"python -m pip install pyserial\"." )
+          print("Exiting...")
+          exit()
+      try:
+         # create the port closed, so DTR can be kept inactive
+         # while opening: this prevents a reset of a running server
+         # (when the USB-serial converter honours it)
+         self._serial_port = serial.Serial(
+            None,
+            baudrate,
+            timeout = _serial_port_timeout,
+            parity=serial.PARITY_NONE
+         )
+         self._serial_port.port = name
+         self._serial_port.dtr = False
+         self._serial_port.open()
+      except serial.serialutil.SerialException:
+          print(
+             "The serial port %s could not be opened. "
+             "You can use the device manager to change the name of "
+             "the port the Arduino server is connected to. "
+             "An Arduino Due must be disconnected and re-connected "
+             "to effectuate a name change." % name )
+          print("Exiting...")
+          exit()
+
+    def _reset( self ):
+      # reset-and-run sequence for a DB100/DB103 server
+      # (the port is opened with DTR inactive, so assert it here)
+      self._serial_port.setRTS( 0 ) # run mode
+      self._serial_port.setDTR( 1 ) # reset
+      time.sleep( 0.1 )
+      self._serial_port.setDTR( 0 ) # release reset
+
+    def _hello( self, timeout: float ) -> bool:
+      """Send a hello, return whether the server answered in time.
+
+      Junk received before the answer is ignored.
+      """
+      self._serial_port.timeout = timeout
+      self._serial_port.write( bytes( [ _commands.hello.value << 5 ] ) )
+      d = self._serial_port.read_until( _hello_response )
+      self._serial_port.timeout = _serial_port_timeout
+      if self._debug_log:
+         print( "hello ", d )
+      return d.endswith( _hello_response )
+
     def _empty_serial_input( self ):
-      while True:
-         d = _serial_port.read()
-         if d == b'':
-            return
-         if self._debug_log: 
-            print( "emptying ", d )
-         time.sleep( 0.001 )
-         
-    def _read_byte( self ):
-      for i in range( 0, 10 ):
-         d = _serial_port.read()       
-         if d != b'':
-            if self._debug_log: 
-               print( "response ", d )
-            return d       
-         time.sleep( 0.001 )
-      return None   
-         
-    def _write_byte( self, b ):
-       _serial_port.flush()
-       if self._debug_log:
-          print( 
-             "command cmd=%d pin=%d byte=%d c=%c" 
-             % ( b >> 5, b & 0x1F, b, chr( b )) )   
-       _serial_port.write( chr( b ).encode( 'utf-8' ) )
-      
-    def _command(self, cmd, pin):
-        self._empty_serial_input()    
-        d = (cmd.value << 5) + pin
-        if cmd != _commands.read:         
-           self._write_byte(d)         
-        else:
-           while True:
-              self._write_byte(d)
-              x = self._read_byte()
-              if x != None:
-                 return x
-            
+      self._serial_port.reset_input_buffer()
+
+    def _drain_serial_input( self, timeout: float ):
+      """Read and discard input until the line is quiet for the timeout.
+      """
+      self._serial_port.timeout = timeout
+      while self._serial_port.read( 256 ) != b'':
+         pass
+      self._serial_port.timeout = _serial_port_timeout
+
+    def _read_bytes( self, n: int ) -> bytes:
+      d = self._serial_port.read( n )
+      if self._debug_log:
+         print( "response ", d )
+      return d
+
+    def write( self, data: bytes ):
+      """Send (or, when batching, queue) command bytes to the server.
+      """
+      if self._debug_log:
+         for b in data:
+            print(
+               "command cmd=%d pin=%d byte=%d c=%c"
+               % ( b >> 5, b & 0x1F, b, chr( b )) )
+      self._queue += data
+      if not self.batching:
+         self.flush()
+
+    def flush( self ):
+      """Send all queued command bytes to the server in one write.
+      """
+      if self._queue:
+         self._serial_port.write( bytes( self._queue ) )
+         self._queue.clear()
+
+    @contextlib.contextmanager
+    def batch( self ):
+      """Context manager that batches the commands sent within it.
+
+      The queued commands are flushed when the block is left.
+      """
+      batching = self.batching
+      self.batching = True
+      try:
+         yield self
+      finally:
+         self.batching = batching
+         self.flush()
+
+    def command( self, cmd: _commands, pin: int ):
+      """Send a (silent) command for a pin.
+      """
+      self.write( bytes( [ ( cmd.value << 5 ) + pin ] ) )
+
+    def _request( self, data: bytes, n: int, decode ) -> '_response':
+      self._queue += data
+      response = _response( self, n, decode )
+      self._pending.append( response )
+      if not self.batching:
+         self.flush()
+      return response
+
+    def _collect( self, response: '_response' ):
+      """Read the responses of pending requests, up to the response.
+
+      The responses arrive in the order of the requests.
+      """
+      self.flush()
+      while not response._done:
+         r = self._pending[ 0 ]
+         d = self._read_bytes( r._n )
+         if len( d ) < r._n:
+            # lost synchronisation: fail all outstanding requests
+            error = Exception(
+               "no response from the GPIO server on %s" % self.name )
+            for p in self._pending:
+               p._error = error
+               p._done = True
+            self._pending.clear()
+            self._empty_serial_input()
+            raise error
+         self._pending.popleft()
+         r._value = r._decode( d )
+         r._done = True
+
+    def read_request( self, pin: int ) -> '_response':
+      """Send a read command for a pin, return the pending response.
+
+      The response value is True or False.
+      """
+      return self._request(
+         bytes( [ ( _commands.read.value << 5 ) + pin ] ),
+         1,
+         _decode_pin )
+
+    def read( self, pin: int ) -> bool:
+      """Send a read command for a pin, and return the response.
+
+      Any queued commands are sent together with the read command.
+      """
+      return self.read_request( pin ).result()
+
+    def write_port( self, mask: int, value: int ):
+      """Write the value to the server pins selected by the mask.
+      """
+      self.write(
+         bytes( [ _commands.write_port.value << 5 ] )
+         + mask.to_bytes( 4, 'little' )
+         + ( value & mask ).to_bytes( 4, 'little' ) )
+
+    def read_port_request( self, mask: int, decode = None ) -> '_response':
+      """Send a read_port command, return the pending response.
+
+      The response value is the int value of the pins selected
+      by the mask, passed through decode when one is specified.
+      """
+      def decode_port( d ):
+         word = int.from_bytes( d, 'little' ) & mask
+         return word if decode == None else decode( word )
+      return self._request(
+         bytes( [ _commands.read_port.value << 5 ] )
+            + mask.to_bytes( 4, 'little' ),
+         4,
+         decode_port )
+
+    def read_port( self, mask: int ) -> int:
+      """Read and return the server pins selected by the mask.
+
+      Any queued commands are sent together with the read command.
+      """
+      return self.read_port_request( mask ).result()
+
+def _decode_pin( d: bytes ) -> bool:
+    if not d in [ b'0', b'1' ]:
+       print( "Invalid read response from server [%d]" % d[ 0 ] )
+    return d == b'1'
+
+class _response:
+    """A pending response to a read request sent to a GPIO server.
+
+    Read requests can be pipelined: any number of requests can be
+    sent before the first response is collected.
+    The responses are collected in the order of the requests.
+    """
+
+    def __init__( self, server: _server, n: int, decode ):
+      self._server = server
+      self._n = n
+      self._decode = decode
+      self._done = False
+      self._value = None
+      self._error = None
+
+    def done( self ) -> bool:
+      """Return whether the response has been received (or failed).
+      """
+      return self._done
+
+    def result( self ):
+      """Wait for the response, and return its value.
+
+      When the server didn't respond, an exception is raised
+      (for this and for all other outstanding responses).
+      """
+      if not self._done:
+         self._server._collect( self )
+      if self._error != None:
+         raise self._error
+      return self._value
+
+_servers = {}
+
+def server( name: str = None, baudrate: int = None ) -> _server:
+    """Return the connection to the GPIO server on the named serial port.
+
+    The connections are kept in a pool, keyed by the port name,
+    so each server is opened only once, and keeps its own
+    state and write queue.
+    The default port and baudrate are
+    _serial_port_name and _serial_port_baudrate.
+    """
+    if name == None:
+       name = _serial_port_name
+    if baudrate == None:
+       baudrate = _serial_port_baudrate
+    if not name in _servers:
+       _servers[ name ] = _server( name, baudrate )
+    return _servers[ name ]
+
+def _as_server( s ) -> _server:
+    if isinstance( s, _server ):
+       return s
+    return server( s )
+
+def flush_servers():
+    """Send the queued commands of all open server connections.
+    """
+    for s in _servers.values():
+       s.flush()
+
+class _server_gpio:
+    """A remote GPIO pin on a server.
+
+    This is a GPIO pin that is provided by a GPIO server.
+    It is used via serial connection, see _server.
+    """
+
+    def __init__( self, nr : pins, server = None ):
+      """Create a remote gpio from its pin and its server.
+
+      The server can be a server connection, the name of the
+      serial port of the server, or None for the default server.
+      """
+      # d0 and d1 are claimed for the communication
+      self.pin = nr.value - 2
+      self._server = _as_server( server )
+
     def make_input( self, pullup = True, pulldown = False ):
       """Make the gpio an input, default with (only) pull-up
       """
-      self._command( 
-         _commands.input, 
-         self.pin 
+      self._server.command(
+         _commands.input,
+         self.pin
       )
-      
+
     def make_output( self ):
       """Make the gpio an output
       """
-      self._command( 
-        _commands.output, 
+      self._server.command(
+        _commands.output,
         self.pin
       )
 
     def write( self, v ):
-      """Write v (evaluated as boolean) to the gpio. 
-      
+      """Write v (evaluated as boolean) to the gpio.
+
       Note: the gpio must be an output.
+      When the server is batching, the write is only queued.
       """
-      self._command( 
-         _commands.high if v else _commands.low, 
-         self.pin 
+      self._server.command(
+         _commands.high if v else _commands.low,
+         self.pin
       )
 
+    def flush( self ):
+      """Send the queued commands of the server of this gpio.
+      """
+      self._server.flush()
+
+    def read_request( self ) -> _response:
+        """Request the value of the gpio, return the pending response.
+
+        The value (False or True) is returned by result() of the
+        response. Any number of reads can be requested before the
+        results are collected, so the serial latency is paid once.
+        """
+        return self._server.read_request( self.pin )
+
     def read(self) -> bool:
         """Read the value (False or True) of the gpio.
 
         Note: the gpio must be an input.
         """
-        c = self._command(
-            _commands.read,
-            self.pin
-        )
-        if not c in [ b'0', b'1' ]:
-           print( "Invalid read response from server [%d]" % int( c ) )
-        return False if c == b'0' else True
-
-gpio = _server_gpio
\ No newline at end of file
+        return self._server.read( self.pin )
+
+    def _port( self, gpios: list ):
+        """Return a _server_port for the gpios, or None.
+
+        This is possible when all gpios are on the same server.
+        """
+        for g in gpios:
+           if not isinstance( g, _server_gpio ) or g._server != self._server:
+              return None
+        return _server_port( gpios )
+
+    def _oc_sequencer( self, sda: '_server_gpio' ):
+        """Return a _server_oc_sequencer for this (scl) and sda, or None.
+
+        This is possible when both gpios are on the same server.
+        """
+        if not isinstance( sda, _server_gpio ) or sda._server != self._server:
+            return None
+        return _server_oc_sequencer( self, sda )
+
+class _server_port:
+    """A set of remote GPIO pins on one server.
+
+    The pins are read or written in one exchange with the server,
+    using the read_port and write_port commands.
+    Bit 0 of a value corresponds to the first gpio, etc.
+    """
+
+    def __init__( self, gpios: list ):
+      self._server = gpios[ 0 ]._server
+      self._word = _pin_word( [ g.pin for g in gpios ] )
+
+    def write( self, v: int ):
+      """Write the bits of v to the pins.
+      """
+      self._server.write_port( self._word.mask, self._word.word( v ) )
+
+    def read_request( self ) -> _response:
+      """Request the pins, return the pending response.
+
+      The pins are returned by result() of the response,
+      as the bits of an int.
+      """
+      return self._server.read_port_request(
+         self._word.mask, self._word.value )
+
+    def read( self ) -> int:
+      """Read and return the pins as the bits of an int.
+      """
+      return self.read_request().result()
+
+class _server_oc_sequencer:
+    """Replays a sequence of open-collector scl and sda levels on a server.
+
+    This is used by the bit-banged i2c: the commands for a whole
+    transaction are sent as one batch, and the reads of sda are
+    pipelined, so the serial latency is paid once per transaction.
+    Note: a round trip per clock pulse would be needed to wait for
+    clock stretching, so a slave can not stretch the clock.
+    Instead, scl is read after each release, and when a slave held
+    it low the transaction fails (as a stretch timeout).
+    The timing is that of the serial link, which is always
+    slower than the (standard mode) i2c bus frequency.
+    """
+
+    def __init__( self, scl: _server_gpio, sda: _server_gpio ):
+      self._server = scl._server
+      self._scl = scl.pin
+      self._sda = sda.pin
+
+    def _line( self, pin: int, v: int ):
+      if v:
+         self._server.command( _commands.input, pin )
+      else:
+         self._server.command( _commands.output, pin )
+         self._server.command( _commands.low, pin )
+
+    def run(
+       self,
+       steps: list,
+       half_bit_ns: int = 0,
+       stretch_timeout_ns: int = None
+    ) -> list:
+      """Replay the ( scl, sda, sample ) steps, return the samples.
+
+      The timing arguments are ignored, see the class.
+      When a slave held scl low after a release,
+      TimeoutError is raised (after the whole sequence was replayed).
+      """
+      responses = []
+      releases = []
+      scl, sda = 1, 1
+      with self._server.batch():
+         for s_scl, s_sda, sample in steps:
+            if s_scl != scl:
+               scl = s_scl
+               self._line( self._scl, scl )
+               if scl:
+                  releases.append( self._server.read_request( self._scl ) )
+            if s_sda != sda:
+               sda = s_sda
+               self._line( self._sda, sda )
+            if sample:
+               responses.append( self._server.read_request( self._sda ) )
+      samples = [ r.result() for r in responses ]
+      if not all( r.result() for r in releases ):
+         raise TimeoutError
+      return samples
+
+gpio = _server_gpio
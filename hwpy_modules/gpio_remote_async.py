@@ -0,0 +1,277 @@
+"""
+asyncio implementation of remote (host-server) gpio pins and ports
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+import asyncio, collections, time
+
+from hwpy_modules.gpio_remote import pins, _commands, _hello_response
+from hwpy_modules.gpio_remote import _hello_timeout, _startup_timeout
+from hwpy_modules.pin_word import _pin_word
+
+class _async_server:
+    """An asyncio connection to a GPIO server.
+
+    The connection uses an asyncio stream pair (reader and writer),
+    normally a non-blocking serial stream opened by async_server().
+    The pins and ports of a server are awaitable, so one event loop
+    can drive any number of servers (and other devices) concurrently.
+
+    Read requests are pipelined: a read sends its command without
+    waiting for earlier responses, a receiver task hands out the
+    responses in the order of the requests.
+    When a response is missing or invalid, all outstanding requests
+    fail, and the input is discarded until the line is quiet.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        name: str = "",
+        timeout: float = 0.5
+    ):
+        """Create a server connection from an asyncio stream pair.
+        """
+        self.name = name
+        self._reader = reader
+        self._writer = writer
+        self._timeout = timeout
+        self._pending = collections.deque()
+        self._receiver = None
+        self._synchronised = asyncio.Event()
+        self._synchronised.set()
+
+    async def _send( self, data: bytes ):
+        self._writer.write( data )
+        await self._writer.drain()
+
+    async def _drain( self, quiet: float ):
+        """Read and discard input until the line is quiet for the time.
+        """
+        try:
+            while await asyncio.wait_for( self._reader.read( 256 ), quiet ):
+                pass
+        except asyncio.TimeoutError:
+            pass
+
+    async def _lost( self, error: Exception ):
+        """Lost synchronisation: fail all outstanding requests.
+
+        New requests wait until the input has been discarded.
+        """
+        self._synchronised.clear()
+        for n, decode, future in self._pending:
+            if not future.done():
+                future.set_exception( error )
+        self._pending.clear()
+        await self._drain( self._timeout )
+        self._synchronised.set()
+
+    async def _receive( self ):
+        """The receiver task: collect the responses, in order.
+        """
+        try:
+            while self._pending:
+                n, decode, future = self._pending[ 0 ]
+                try:
+                    value = decode( await asyncio.wait_for(
+                       self._reader.readexactly( n ), self._timeout ))
+                except ( asyncio.TimeoutError, asyncio.IncompleteReadError ):
+                    await self._lost( Exception(
+                       "no response from the GPIO server %s" % self.name ))
+                    break
+                except ValueError as error:
+                    await self._lost( error )
+                    break
+                self._pending.popleft()
+                if not future.done():
+                    future.set_result( value )
+        finally:
+            self._receiver = None
+
+    async def _request( self, data: bytes, n: int, decode ):
+        await self._synchronised.wait()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append( ( n, decode, future ))
+        await self._send( data )
+        if self._receiver == None:
+            self._receiver = asyncio.ensure_future( self._receive() )
+        return await future
+
+    async def hello( self, timeout: float = 0.5 ) -> bool:
+        """Send a hello, return whether the server answered in time.
+
+        Junk received before the answer is ignored.
+        Note: use this only when no reads are pending.
+        """
+        await self._send( bytes( [ _commands.hello.value << 5 ] ) )
+        try:
+            await asyncio.wait_for(
+               self._reader.readuntil( _hello_response ), timeout )
+        except ( asyncio.TimeoutError, asyncio.IncompleteReadError ):
+            return False
+        return True
+
+    async def command( self, cmd: _commands, pin: int ):
+        """Send a (silent) command for a pin.
+        """
+        await self._send( bytes( [ ( cmd.value << 5 ) + pin ] ) )
+
+    async def read( self, pin: int ) -> bool:
+        """Read and return the value of a pin.
+        """
+        return await self._request(
+            bytes( [ ( _commands.read.value << 5 ) + pin ] ),
+            1,
+            self._decode_pin )
+
+    def _decode_pin( self, d: bytes ) -> bool:
+        if not d in [ b'0', b'1' ]:
+            raise ValueError(
+               "invalid read response from the GPIO server %s [%d]"
+               % ( self.name, d[ 0 ] ))
+        return d == b'1'
+
+    async def write_port( self, mask: int, value: int ):
+        """Write the value to the server pins selected by the mask.
+        """
+        await self._send(
+            bytes( [ _commands.write_port.value << 5 ] )
+            + mask.to_bytes( 4, 'little' )
+            + ( value & mask ).to_bytes( 4, 'little' ) )
+
+    async def read_port( self, mask: int ) -> int:
+        """Read and return the server pins selected by the mask.
+        """
+        return await self._request(
+            bytes( [ _commands.read_port.value << 5 ] )
+               + mask.to_bytes( 4, 'little' ),
+            4,
+            lambda d: int.from_bytes( d, 'little' ) & mask )
+
+    def close( self ):
+        """Close the connection.
+        """
+        self._writer.close()
+
+
+async def async_server(
+    name: str,
+    baudrate: int = 115200,
+    timeout: float = 0.5
+) -> _async_server:
+    """Open an asyncio connection to a GPIO server on a serial port.
+
+    To use this function, you must install pyserial-asyncio:
+       python -m pip install pyserial-asyncio
+    """
+    try:
+        import serial_asyncio
+    except ImportError:
+        print(
+           "To use asyncio Host GPIO, you need the pyserial-asyncio module,"
+           "install it with \"python -m pip install pyserial-asyncio\"." )
+        print("Exiting...")
+        exit()
+    reader, writer = await serial_asyncio.open_serial_connection(
+        url = name, baudrate = baudrate )
+    server = _async_server( reader, writer, name, timeout )
+
+    # opening the port might reset the server: wait for it to answer
+    if not await server.hello( _hello_timeout ):
+        deadline = time.monotonic() + _startup_timeout
+        while not await server.hello( _hello_timeout ):
+            if time.monotonic() > deadline:
+                print(
+                   "The server on %s does not answer a hello, "
+                   "it might be an old server version." % name )
+                break
+
+        # the answers to the last hellos can still be underway
+        await server._drain( 2 * _hello_timeout )
+    return server
+
+
+class _async_gpio:
+    """A remote GPIO pin on an asyncio server connection.
+
+    This is the awaitable counterpart of the (blocking) remote gpio.
+    """
+
+    def __init__( self, server: _async_server, nr: pins ):
+        """Create a gpio from its server connection and its pin.
+        """
+        # d0 and d1 are claimed for the communication
+        self.pin = nr.value - 2
+        self._server = server
+
+    async def make_input( self, pullup = True, pulldown = False ):
+        """Make the gpio an input, default with (only) pull-up
+        """
+        await self._server.command( _commands.input, self.pin )
+
+    async def make_output( self ):
+        """Make the gpio an output
+        """
+        await self._server.command( _commands.output, self.pin )
+
+    async def write( self, v ):
+        """Write v (evaluated as boolean) to the gpio.
+
+        Note: the gpio must be an output.
+        """
+        await self._server.command(
+            _commands.high if v else _commands.low,
+            self.pin )
+
+    async def read( self ) -> bool:
+        """Read the value (False or True) of the gpio.
+
+        Note: the gpio must be an input.
+        """
+        return await self._server.read( self.pin )
+
+
+class _async_port:
+    """A set of remote GPIO pins on one asyncio server connection.
+
+    The pins are read or written in one exchange with the server.
+    Bit 0 of a value corresponds to the first gpio, etc.
+    """
+
+    def __init__( self, gpios: list ):
+        """Create a port from a list of gpios on the same server.
+        """
+        self._server = gpios[ 0 ]._server
+        self._word = _pin_word( [ g.pin for g in gpios ] )
+        self.n = len( gpios )
+
+    async def make_input( self ):
+        """Make all pins inputs.
+        """
+        for pin in self._word.pins:
+            await self._server.command( _commands.input, pin )
+
+    async def make_output( self ):
+        """Make all pins outputs.
+        """
+        for pin in self._word.pins:
+            await self._server.command( _commands.output, pin )
+
+    async def write( self, v: int ):
+        """Write the bits of v to the pins.
+        """
+        await self._server.write_port( self._word.mask, self._word.word( v ) )
+
+    async def read( self ) -> int:
+        """Read and return the pins as the bits of an int.
+        """
+        return self._word.value(
+            await self._server.read_port( self._word.mask ) )
+
+async_gpio = _async_gpio
+async_port = _async_port
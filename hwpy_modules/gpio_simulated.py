@@ -0,0 +1,248 @@
+"""
+Simulated GPIO server
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+import time, os, threading, collections
+
+from hwpy_modules.gpio_remote import *
+from hwpy_modules.gpio_remote import _commands, _hello_response, _server, _servers
+import hwpy_modules.gpio_remote
+
+class _simulator:
+    """The pins and the command decoder of a simulated GPIO server.
+
+    The simulator implements the byte protocol of the servers
+    (servers/commands.hpp): feed() it the bytes sent by the host,
+    it returns the response bytes.
+
+    A pin that is an output reads back its output level,
+    a pin that is an input reads its external level,
+    which is high (pull-up) unless it is set by set_input().
+    """
+
+    def __init__( self, n_pins: int = 32 ):
+        """Create a simulator with n_pins pins, all inputs.
+        """
+        self.n_pins = n_pins
+        self.is_output = [ False ] * n_pins
+        self.outputs = [ False ] * n_pins
+        self.inputs = [ True ] * n_pins
+        self.n_commands = 0
+        self._command = bytearray()
+
+    def set_input( self, nr: pins, v: bool ):
+        """Set the external level of a pin.
+        """
+        self.inputs[ nr.value - 2 ] = bool( v )
+
+    def level( self, nr: pins ) -> bool:
+        """Return the level of a pin.
+        """
+        return self._level( nr.value - 2 )
+
+    def _level( self, pin: int ) -> bool:
+        if self.is_output[ pin ]:
+            return self.outputs[ pin ]
+        return self.inputs[ pin ]
+
+    def _command_length( self, cmd: int ) -> int:
+        if cmd == _commands.read_port.value:
+            return 5
+        if cmd == _commands.write_port.value:
+            return 9
+        return 1
+
+    def feed( self, data: bytes ) -> bytes:
+        """Process the bytes received from the host, return the response.
+        """
+        response = bytearray()
+        for b in data:
+            self._command.append( b )
+            cmd = self._command[ 0 ] >> 5
+            if len( self._command ) == self._command_length( cmd ):
+                response += self._execute( bytes( self._command ))
+                self._command.clear()
+        return bytes( response )
+
+    def _execute( self, command: bytes ) -> bytes:
+        self.n_commands += 1
+        cmd = _commands( command[ 0 ] >> 5 )
+        pin = command[ 0 ] & 0x1F
+
+        if cmd == _commands.hello:
+            return _hello_response
+
+        if cmd in ( _commands.read_port, _commands.write_port ):
+            mask = int.from_bytes( command[ 1 : 5 ], 'little' )
+            if cmd == _commands.write_port:
+                word = int.from_bytes( command[ 5 : 9 ], 'little' )
+            result = 0
+            for i in range( 0, self.n_pins ):
+                if mask & ( 1 << i ):
+                    if cmd == _commands.write_port:
+                        self.outputs[ i ] = ( word & ( 1 << i )) != 0
+                    elif self._level( i ):
+                        result |= 1 << i
+            if cmd == _commands.read_port:
+                return result.to_bytes( 4, 'little' )
+            return b''
+
+        if pin >= self.n_pins:
+            return b''
+        if cmd == _commands.input:
+            self.is_output[ pin ] = False
+        elif cmd == _commands.output:
+            self.is_output[ pin ] = True
+        elif cmd == _commands.high:
+            self.outputs[ pin ] = True
+        elif cmd == _commands.low:
+            self.outputs[ pin ] = False
+        elif cmd == _commands.read:
+            return b'1' if self._level( pin ) else b'0'
+        return b''
+
+
+class _simulated_serial:
+    """An in-memory serial port to a simulator.
+
+    This provides the part of the PySerial interface that is
+    used by a server connection.
+    The timing of a real serial link can be modelled:
+    each byte takes 10 bit times at the baudrate (None: no delay),
+    and each response is delayed by the latency (in seconds).
+    """
+
+    def __init__(
+        self,
+        simulator: _simulator,
+        baudrate: int = None,
+        latency: float = 0.0
+    ):
+        self.simulator = simulator
+        self.timeout = None
+        self.port = "simulated"
+        self.dtr = False
+        self._byte_time = 0.0 if baudrate == None else 10.0 / baudrate
+        self._latency = latency
+        self._line_free = 0.0
+        self._responses = collections.deque()
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def open( self ):
+        pass
+
+    def close( self ):
+        pass
+
+    def setRTS( self, v ):
+        pass
+
+    def setDTR( self, v ):
+        pass
+
+    def reset_input_buffer( self ):
+        self._responses.clear()
+
+    def write( self, data: bytes ):
+        """Send bytes to the simulator.
+
+        The responses become available when they would have
+        been transferred over the modelled link.
+        """
+        self.bytes_written += len( data )
+        t = max( time.perf_counter(), self._line_free )
+        for b in data:
+            t += self._byte_time
+            for r in self.simulator.feed( bytes( [ b ] ) ):
+                t += self._byte_time
+                self._responses.append( ( t + self._latency, r ))
+        self._line_free = t
+        return len( data )
+
+    def read( self, n: int = 1 ) -> bytes:
+        """Read up to n bytes, wait at most timeout seconds.
+        """
+        deadline = None if self.timeout == None else (
+            time.perf_counter() + self.timeout )
+        result = bytearray()
+        while len( result ) < n and self._responses:
+            ready, b = self._responses[ 0 ]
+            delay = ready - time.perf_counter()
+            if delay > 0:
+                if deadline != None and ready > deadline:
+                    time.sleep( max( 0.0, deadline - time.perf_counter() ))
+                    break
+                time.sleep( delay )
+            self._responses.popleft()
+            result.append( b )
+        self.bytes_read += len( result )
+        return bytes( result )
+
+    def read_until( self, expected: bytes ) -> bytes:
+        result = bytearray()
+        while not result.endswith( expected ):
+            d = self.read( 1 )
+            if d == b'':
+                break
+            result += d
+        return bytes( result )
+
+
+def simulated_server(
+    name: str = None,
+    n_pins: int = 32,
+    baudrate: int = None,
+    latency: float = 0.0
+) -> _server:
+    """Create a simulated GPIO server, and add it to the server pool.
+
+    The server can then be used by name, like a real server:
+       hwpy.simulated_server( "sim" )
+       led = hwpy.gpo( hwpy.arduino.d13, server = "sim" )
+    Without a name, the simulated server replaces the default server.
+    The simulator itself is server._serial_port.simulator.
+    By default the link has no delays, specify the baudrate
+    and latency to model a real serial link.
+    """
+    if name == None:
+        name = hwpy_modules.gpio_remote._serial_port_name
+    port = _simulated_serial( _simulator( n_pins ), baudrate, latency )
+    _servers[ name ] = _server( name, baudrate, port )
+    return _servers[ name ]
+
+
+def simulated_pty(
+    n_pins: int = 32,
+    latency: float = 0.0
+) -> tuple:
+    """Run a simulator on a pseudo-terminal.
+
+    A thread runs the simulator on the master side of a new
+    pseudo-terminal (Linux only). The simulator and the name of
+    the slave side are returned. The name can be used as
+    serial port name of a (blocking or asyncio) server connection.
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw( slave )
+    simulator = _simulator( n_pins )
+
+    def run():
+        while True:
+            try:
+                data = os.read( master, 256 )
+            except OSError:
+                return
+            response = simulator.feed( data )
+            if response:
+                if latency > 0:
+                    time.sleep( latency )
+                os.write( master, response )
+
+    threading.Thread( target = run, daemon = True ).start()
+    return simulator, os.ttyname( slave )
@@ -6,7 +6,7 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
-import typing
+import typing, time
 
 from hwpy_modules.xy import *
 from hwpy_modules.gpio import *
@@ -14,6 +14,142 @@ from hwpy_modules.port import *
 from hwpy_modules.pcf8574 import *
 from hwpy_modules.wait import *
 
+class hd44780_pins:
+    """HD44780 transport: the RS and E pins and a 4-bit data port.
+
+    A transport writes (is_data, byte) pairs to the controller:
+    write4() writes a single nibble (used for the initialization),
+    write() writes a list of (is_data, byte) pairs,
+    ready() waits (at most max_us) until the controller is ready
+    for the next byte.
+
+    Without the R/W pin (tied to ground), each nibble is followed
+    by a fixed delay that is long enough for any (character or cursor)
+    command, and ready() waits max_us.
+    With the R/W pin, the busy flag of the controller is read
+    before each byte, so a byte takes only as long as the controller
+    needs. The data port must then be a port of gpio pins
+    (which can be made input and output).
+    """
+
+    def __init__(self, pin_rs: gpo, pin_e: gpo, port_data: port, pin_rw: gpo = None):
+        """Create a transport from the RS and E pins and the D4..D7 port,
+        and optionally the R/W pin.
+        """
+        self._rs = pin_rs
+        self._e = pin_e
+        self._data = port_data
+        self._rw = pin_rw
+        self._e.write(0)
+        self._rs.write(0)
+        if self._rw != None:
+            self._rw.write(0)
+
+    def write4(self, nibble: int):
+        """Write a nibble (4 bits) to the chip.
+        """
+        wait_us(10)
+        self._data.write(nibble)
+        wait_us(20)
+        self._e.write(1)
+        wait_us(20)
+        self._e.write(0)
+        wait_us(100)
+
+    def _pulse4(self, nibble: int):
+        """Write a nibble (4 bits) to the chip, without delays.
+        """
+        self._data.write(nibble)
+        self._e.write(1)
+        self._e.write(0)
+
+    def _busy(self) -> bool:
+        """Read and return the busy flag.
+        """
+        self._rs.write(0)
+        self._data.make_input()
+        self._rw.write(1)
+        self._e.write(1)
+        busy = (self._data.read() & 0x08) != 0
+        self._e.write(0)
+
+        # the low nibble of the address counter must be clocked out too
+        self._e.write(1)
+        self._e.write(0)
+        self._rw.write(0)
+        self._data.make_output()
+        return busy
+
+    def ready(self, max_us: int = 100):
+        """Wait until the controller is ready, at most max_us.
+        """
+        if self._rw == None:
+            wait_us(max_us)
+            return
+        deadline = time.perf_counter_ns() + max_us * 1000
+        while self._busy() and time.perf_counter_ns() < deadline:
+            pass
+
+    def write(self, data: list):
+        """Write the (is_data, byte) pairs, each as two nibbles.
+        """
+        if self._rw == None:
+            for is_data, byte in data:
+                self._rs.write(is_data)
+                self.write4(byte >> 4)
+                self.write4(byte)
+            return
+
+        for is_data, byte in data:
+            self.ready(2000)
+            self._rs.write(is_data)
+            self._pulse4(byte >> 4)
+            self._pulse4(byte)
+
+class hd44780_pcf8574:
+    """HD44780 transport: a pcf8574 i2c backpack.
+
+    The common backpacks connect the pcf8574 pins as
+    P0 = RS, P1 = R/W, P2 = E, P3 = backlight, P4..P7 = D4..D7.
+    Each nibble is written as three pcf8574 values (E low, high, low),
+    and all values for a write() are sent in one i2c transaction,
+    which the pcf8574 outputs one by one.
+    At standard i2c speeds, the byte time of the i2c bus is longer
+    than the execution time of a (character or cursor) command.
+    """
+
+    def __init__(self, chip, backlight: bool = True):
+        """Create a transport from the pcf8574 (or pcf8574a).
+        """
+        self._chip = chip
+        self._backlight = 0x08 if backlight else 0x00
+        chip.write(self._backlight)
+
+    def _nibble(self, values: list, is_data: int, nibble: int):
+        b = ((nibble & 0x0F) << 4) | self._backlight | (0x01 if is_data else 0x00)
+        values += [b, b | 0x04, b]
+
+    def ready(self, max_us: int = 100):
+        """Wait max_us (the R/W pin is not used).
+        """
+        wait_us(max_us)
+
+    def write4(self, nibble: int):
+        """Write a nibble (4 bits) to the chip.
+        """
+        values = []
+        self._nibble(values, 0, nibble)
+        self._chip.write_sequence(values)
+
+    def write(self, data: list):
+        """Write the (is_data, byte) pairs, in one i2c transaction.
+        """
+        values = []
+        for is_data, byte in data:
+            self._nibble(values, is_data, byte >> 4)
+            self._nibble(values, is_data, byte)
+        self._chip.write_sequence(values)
+
 class hd44780:
     """4-bit interface to an HD44780 (character) LCD.
 
@@ -22,68 +158,109 @@ class hd44780:
       - '\\r' puts the cursor at the start of the current line
       - '\\f' puts the cursor at the top-left position and clears the lcd
       - '\\txxyy' puts the cursor at the position (xx,yy)
+
+    The lcd is written via a transport: by default its RS and E pins
+    and a 4-bit data port (hd44780_pins), or a pcf8574 backpack
+    (hd44780_pcf8574). The bytes for a write() or flush() are
+    passed to the transport as one list.
+
+    The lcd keeps track of the address counter of the controller,
+    so a cursor command is only sent when the next character is
+    not written at the next address anyway.
+
+    When buffered is True, the characters are written to a
+    framebuffer, and only flush() writes to the lcd:
+    only the characters that differ from what is shown are written,
+    and a cursor command is only sent at the start of a run of
+    changed characters.
     """
 
     @classmethod
-    def from_pcf8574(cls, pcf_port: pcf8574, size: xy) -> 'hd44780':
+    def from_pcf8574(
+        cls,
+        pcf_port: pcf8574,
+        size: xy,
+        buffered: bool = False
+    ) -> 'hd44780':
         """Create an HD44780 instance from an i2c bus
 
-        This should be used when using a pcf8574 i2c backpack with the lcd"""
-        pcf_port.p3.write(True)
-        port_4bit = port([pcf_port.pins[i] for i in range(4, 8)])
-        return hd44780(pcf_port.p0, pcf_port.p2, port_4bit, size)
+        This should be used when using a pcf8574 i2c backpack with the lcd.
+        The characters are sent in one i2c transaction per write(),
+        see hd44780_pcf8574."""
+        return cls.from_transport(hd44780_pcf8574(pcf_port), size, buffered)
 
-    def __init__(self, pin_rs: gpo, pin_e: gpo, port_data: port, size: xy):
+    @classmethod
+    def from_transport(cls, transport, size: xy, buffered: bool = False) -> 'hd44780':
+        """Create an HD44780 instance from a transport.
+        """
+        lcd = cls.__new__(cls)
+        lcd._init(transport, size, buffered)
+        return lcd
+
+    def __init__(
+        self,
+        pin_rs: gpo,
+        pin_e: gpo,
+        port_data: port,
+        size: xy,
+        buffered: bool = False,
+        pin_rw: gpo = None
+    ):
         """Interface to a hd44780.
 
         Construct an interface to an LCD controlled by an hd44780 chip
         from the RS and E pins, the 4-bit port to the D4..D8 pins,
         and the size (number of characters per line, and number of lines),
         and initializes the controller.
+        When the R/W pin is specified, the busy flag is used instead of
+        fixed delays, see hd44780_pins.
         """
-        self._rs = pin_rs
-        self._e = pin_e
-        self._data = port_data
+        self._init(
+            hd44780_pins(pin_rs, pin_e, port_data, pin_rw), size, buffered)
+
+    def _init(self, transport, size: xy, buffered: bool):
+        """Initialize the interface and the controller.
+        """
+        self._transport = transport
+        self._queue = []
         self.size = size
         self._position = xy(0, 0)
+        self._address = None
+        self._buffered = buffered
+        self._frame = [[' '] * size.x for y in range(0, size.y)]
+        self._shown = [[' '] * size.x for y in range(0, size.y)]
 
-        self._e.write(0)
-        self._rs.write(0)
         wait_ms(100)
 
         # interface initialization: make sure the LCD is in 4 bit mode
         # (magical sequence, taken from the HD44780 data-sheet)
-        self._write4(0x03)
+        self._transport.write4(0x03)
         wait_ms(15)
-        self._write4(0x03)
+        self._transport.write4(0x03)
         wait_us(100)
-        self._write4(0x03)
-        self._write4(0x02)  # 4 bit mode
+        self._transport.write4(0x03)
+        self._transport.write4(0x02)  # 4 bit mode
 
         # functional initialization
         self.command(0x28)  # 4 bit mode, 2 lines, 5x8 font
         self.command(0x0C)  # display on, no cursor, no blink
+        if self._buffered:
+            self._clear_display()  # clear() only clears the framebuffer
         self.clear()  # clear display, 'cursor' home
         self.command(0x06)  # Set mode left-to-right
         self._goto_state = 0
 
-    def _write4(self, nibble: int):
-        """Write a nibble (4 bits) to the chip.
+    def _write8(self, is_data: int, byte: int):
+        """Queue a byte as command or data.
         """
-        wait_us(10)
-        self._data.write(nibble)
-        wait_us(20)
-        self._e.write(1)
-        wait_us(20)
-        self._e.write(0)
-        wait_us(100)
+        self._queue.append((is_data, byte))
 
-    def _write8(self, is_data: int, byte: int):
-        """Write a byte (two nibbles) as command or data.
+    def _send(self):
+        """Write the queued bytes.
         """
-        self._rs.write(is_data)
-        self._write4((byte >> 4))
-        self._write4(byte)
+        if self._queue:
+            self._transport.write(self._queue)
+            self._queue = []
 
     def command(self, cmd: int):
         """Write a command byte to the LCD
@@ -92,8 +269,18 @@ class hd44780:
         provided by the console interface, like the definition
         of the user-defined characters.
         """
+        self._command(cmd)
+        self._send()
+
+    def _command(self, cmd: int):
+        """Queue a command byte.
+        """
         self._write8(0, cmd)
 
+        # a set DDRAM address command sets the address counter,
+        # after other commands it is unknown (or not in DDRAM)
+        self._address = (cmd & 0x7F) if (cmd & 0x80) else None
+
     def data(self, char: typing.Union[str, bytes]):
         """Write a data byte to the LCD
 
@@ -101,40 +288,103 @@ class hd44780:
         provided by the console interface, like the definition
         of the user-defined characters.
         """
+        self._data(char)
+        self._send()
+
+    def _data(self, char: typing.Union[str, bytes]):
+        """Queue a data byte.
+        """
         self._write8(1, ord(char))
+        if self._address != None:
+            self._address += 1
 
     def clear(self):
         """Clear the display and put the cursor at (0,0).
+
+        When buffered, only the framebuffer is cleared.
         """
-        self.command(0x01)
-        wait_ms(5)
+        if self._buffered:
+            for line in self._frame:
+                line[:] = [' '] * self.size.x
+        else:
+            self._clear_display()
         self.cursor(xy(0, 0))
 
-    def cursor(self, position: xy):
-        """Place the cursor at the position.
+    def _clear_display(self):
+        """Clear the lcd itself (not the framebuffer).
+        """
+        self._command(0x01)
+        self._send()
+        self._transport.ready(5000)
+        for line in self._shown:
+            line[:] = [' '] * self.size.x
+
+    def _ddram_address(self, position: xy) -> int:
+        """Return the DDRAM address of the character at the position.
         """
-        self._position = position
-
         if self.size.y == 1:
-            if self._position.x < 8:
-                self.command(0x80 + self._position.x)
+            if position.x < 8:
+                return position.x
             else:
-                self.command(0x80 + 0x40 + (self._position.x - 8))
+                return 0x40 + (position.x - 8)
         else:
             if self.size.y == 2:
-                self.command(
-                    0x80
-                    + (0x40 if (self._position.y > 0) else 0x00)
-                    + self._position.x)
+                return (0x40 if (position.y > 0) else 0x00) + position.x
             else:
-                self.command(
-                    0x80
-                    + (0x40 if (self._position.y & 0x01) else 0x00)
-                    + (0x14 if (self._position.y & 0x02) else 0x00))
+                return (
+                    (0x40 if (position.y & 0x01) else 0x00)
+                    + (0x14 if (position.y & 0x02) else 0x00)
+                    + position.x)
+
+    def _goto(self, position: xy):
+        """Set the address counter to the position, when needed.
+        """
+        address = self._ddram_address(position)
+        if address != self._address:
+            self._command(0x80 + address)
+
+    def cursor(self, position: xy):
+        """Place the cursor at the position.
+
+        When buffered, this only sets the position in the framebuffer.
+        """
+        self._cursor(position)
+        self._send()
+
+    def _cursor(self, position: xy):
+        """Queue the cursor command (when not buffered).
+        """
+        self._position = position
+        if not self._buffered:
+            self._command(0x80 + self._ddram_address(position))
+
+    def flush(self, full: bool = False):
+        """Write the changed characters of the framebuffer to the lcd.
+
+        When full is True, all characters are written,
+        which is needed when the lcd was changed by other means.
+        Without a framebuffer, this does nothing.
+        """
+        if not self._buffered:
+            return
+        for y in range(0, self.size.y):
+            frame, shown = self._frame[y], self._shown[y]
+            for x in range(0, self.size.x):
+                if full or frame[x] != shown[x]:
+                    self._goto(xy(x, y))
+                    self._data(frame[x])
+                    shown[x] = frame[x]
+        self._send()
 
     def write_char(self, char):
         """Write a single char.
         """
+        self._write_char(char)
+        self._send()
+
+    def _write_char(self, char):
+        """Queue a single char.
+        """
         if self._goto_state == 0:
             pass
         elif self._goto_state == 1:
@@ -153,17 +403,17 @@ class hd44780:
         elif self._goto_state == 4:
             self._position.y += ( ord( char ) - ord( '0' ) )
             self._goto_state = 0
-            self.cursor(self._position)
+            self._cursor(self._position)
             return
 
         if (char == '\n'):
-            self.cursor(xy(0, self._position.y + 1))
+            self._cursor(xy(0, self._position.y + 1))
 
         elif (char == '\r'):
-            self.cursor(xy(0, self._position.y))
+            self._cursor(xy(0, self._position.y))
 
         elif (char == '\v'):
-            self.cursor(xy(0, 0))
+            self._cursor(xy(0, 0))
 
         elif (char == '\f'):
             self.clear()
@@ -178,11 +428,12 @@ class hd44780:
                 and (self._position.y < self.size.y)
         ):
 
-            # handle the gap for 1-line displays
-            if (self.size.x == 1) and (self._position.x == 8):
-                self.cursor(self._position)
-            self.cursor(self._position)
-            self.data(char)
+            if self._buffered:
+                self._frame[self._position.y][self._position.x] = char
+            else:
+                self._goto(self._position)
+                self._data(char)
+                self._shown[self._position.y][self._position.x] = char
 
             self._position.x += 1
 
@@ -190,4 +441,5 @@ class hd44780:
         """Write a string.
         """
         for c in text:
-            self.write_char(c)
+            self._write_char(c)
+        self._send()
@@ -6,6 +6,8 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
+import time
+
 from hwpy_modules.gpio import *
 from hwpy_modules.i2c_interface import *
 
@@ -14,155 +16,303 @@ class i2c_from_scl_sda( i2c_interface):
 
     This is a bit-banged i2c interface.
     This interface is slow, but can be used on any pin pair.
+
+    A transaction is first compiled into the complete sequence of
+    (open-collector) SCL and SDA levels, which is then replayed.
+    When the gpio backend of the pins provides a sequencer
+    (gpio._oc_sequencer), the whole sequence is replayed by the
+    backend in one call. Otherwise it is replayed via the pins,
+    writing a pin only when its level changes.
+    In both cases, after each release of SCL the replay waits
+    while a slave stretches the clock (holds SCL low), but at most
+    the stretch timeout: then i2c_error is raised.
+    When that happens, recover() can be used to free the bus.
+
+    Note: the sequencer of a remote (server) gpio can't wait for a
+    slave, and ignores the frequency and the stretch timeout: a slave
+    that stretches the clock at all makes the transaction raise i2c_error.
     """
 
-    def __init__(self, scl: gpoc, sda: gpoc):
+    def __init__(
+        self,
+        scl: gpoc,
+        sda: gpoc,
+        frequency: int = None,
+        stretch_timeout: float = 0.01
+    ):
         """Create a bit-banged i2c from the scl and sda pins.
+
+        The frequency is the (maximum) bus frequency in Hz.
+        The default None is as fast as the pins can be written,
+        a lower frequency can be needed for long cables or slow slaves.
+        The stretch_timeout (in seconds) is the maximum time a slave
+        can hold SCL low, None means no limit.
         """
         self._scl = scl
         self._sda = sda
+        self._half_bit_ns = 0 if frequency == None else (
+            1_000_000_000 // (2 * frequency))
+        self._stretch_timeout_ns = None if stretch_timeout == None else (
+            int(stretch_timeout * 1_000_000_000))
+        self._edge_ns = 0
         self._scl.write(1)
         self._sda.write(1)
 
+        self._sequencer = None
+        try:
+            self._sequencer = self._scl._pin._oc_sequencer(self._sda._pin)
+        except AttributeError:
+            pass
+
     def _wait(self):
         """Internal function that waits half a bit-cell.
 
-        Currently this function does nothing,
-        because bit-banged i2c is already slow.
+        This waits until half a bit-cell after the previous edge,
+        so the time spent writing the pins is part of the half bit.
+        The wait is a busy-wait: a sleep would take much longer.
+        Without a frequency this function does nothing.
         """
-        pass
+        if self._half_bit_ns:
+            deadline = self._edge_ns + self._half_bit_ns
+            now = time.perf_counter_ns()
+            while now < deadline:
+                now = time.perf_counter_ns()
+            self._edge_ns = now
 
-    def _write_one_bit(self, v: int):
-        """Write a single bit.
-        """
-        self._scl.write(0)
-        self._wait()
-        self._sda.write(v)
-        self._scl.write(1)
+    def _wait_scl(self):
+        """Internal function that waits while a slave stretches the clock.
 
-        while not self._scl.read():
-            self._wait()
-
-    def _read_one_bit(self) -> int:
-        """Read and return a single bit.
+        Raises TimeoutError after the stretch timeout.
         """
-        self._scl.write(0)
-        self._sda.write(1)
-        self._wait()
-        self._scl.write(1)
-
+        if self._scl.read():
+            return
+        deadline = None
+        if self._stretch_timeout_ns != None:
+            deadline = time.perf_counter_ns() + self._stretch_timeout_ns
         while not self._scl.read():
-            self._wait()
+            if deadline != None and time.perf_counter_ns() > deadline:
+                raise TimeoutError
+
+    # =======================================================================
+    #
+    # compilation of a transaction into steps
+    #
+    # Each step is a (scl, sda, sample) tuple: the levels of the lines,
+    # and whether SDA must be sampled after the step.
+    # Each step changes at most one line.
+    #
+    # =======================================================================
+
+    def _write_one_bit(self, steps: list, v: int):
+        """Write a single bit.
+        """
+        v = 1 if v else 0
+        steps.append((0, steps[-1][1], False))
+        steps.append((0, v, False))
+        steps.append((1, v, False))
 
-        b = self._sda.read()
-        self._wait()
-        return b
+    def _read_one_bit(self, steps: list):
+        """Read a single bit (as a sample).
+        """
+        steps.append((0, steps[-1][1], False))
+        steps.append((0, 1, False))
+        steps.append((1, 1, True))
 
-    def _write_ack(self):
+    def _write_ack(self, steps: list):
         """Write an i2c ACK.
         """
-        self._write_one_bit(0)
+        self._write_one_bit(steps, 0)
 
-    def _write_nack(self):
+    def _write_nack(self, steps: list):
         """Write an i2c NACK
         """
-        self._write_one_bit(1)
+        self._write_one_bit(steps, 1)
 
-    def _write_start(self):
-        """Write an i2c START condition.
+    def _write_start(self, steps: list):
+        """Write an i2c START condition (from an idle bus).
         """
-        self._sda.write(0)
-        self._wait()
-        self._scl.write(0)
-        self._wait()
+        steps.append((1, 1, False))
+        steps.append((1, 0, False))
+        steps.append((0, 0, False))
 
-    def _write_stop(self):
+    def _write_repeated_start(self, steps: list):
+        """Write an i2c repeated START condition.
+        """
+        steps.append((0, steps[-1][1], False))
+        steps.append((0, 1, False))
+        steps.append((1, 1, False))
+        steps.append((1, 0, False))
+        steps.append((0, 0, False))
+
+    def _write_stop(self, steps: list):
         """Write an i2c STOP condition.
         """
-        self._scl.write(0)
-        self._wait()
-        self._sda.write(0)
-        self._wait()
-        self._scl.write(1)
-        self._wait()
-        self._sda.write(1)
-        self._wait()
+        steps.append((0, steps[-1][1], False))
+        steps.append((0, 0, False))
+        steps.append((1, 0, False))
+        steps.append((1, 1, False))
 
-    def _read_ack(self) -> bool:
-        """Read and return an i2c ACK bit.
+    def _read_ack(self, steps: list):
+        """Read an i2c ACK bit (as a sample, which is ignored).
         """
-        return not self._read_one_bit()
+        self._read_one_bit(steps)
 
-    def _read_one_byte(self) -> int:
-        """Read an return a single byte (as part of an i2c transaction).
+    def _read_one_byte(self, steps: list):
+        """Read a single byte (as 8 samples).
         """
-        result = 0
-        mask = 0x80
         for i in range(0, 8):
-            if self._read_one_bit():
-                result = result | mask
-            mask = mask >> 1
-        return result
+            self._read_one_bit(steps)
 
-    def _write_one_byte(self, byte: int):
+    def _write_one_byte(self, steps: list, byte: int):
         """Write a single byte (as part of an i2c transaction).
         """
         mask = 0x80
         for i in range(0, 8):
-            self._write_one_bit(byte & mask)
+            self._write_one_bit(steps, byte & mask)
             mask = mask >> 1
 
-    def write(self, address: int, data: list):
-        """An i2c write transaction
-
-        Perform an i2c write transaction:
-        write the bytes to the chip with
-        the (7-bit) address.
+    def _write_part(self, steps: list, address: int, data: list):
+        """Write the address (for a write) and the data bytes.
         """
-        self._write_start()
-        self._write_one_byte((address << 1) + 0x00)
-        self._read_ack()
+        self._write_one_byte(steps, (address << 1) + 0x00)
+        self._read_ack(steps)
 
         for b in data:
-            self._write_one_byte(b)
-            self._read_ack()
-
-        self._write_stop()
+            self._write_one_byte(steps, b)
+            self._read_ack(steps)
 
-    def read(self, address: int, n: int) -> list:
-        """An i2c read transaction.
-
-        Perform an i2c read transaction:
-        read and return n bytes from the chip with
-        the (7-bit) address.
+    def _read_part(self, steps: list, address: int, n: int):
+        """Write the address (for a read), and read n bytes.
         """
-        self._write_start()
-        self._write_one_byte((address << 1) + 0x01)
-        self._read_ack()
+        self._write_one_byte(steps, (address << 1) + 0x01)
+        self._read_ack(steps)
 
-        result = []
         first = 1
         for i in range(0, n):
             if not first:
-                self._write_ack()
+                self._write_ack(steps)
             first = 0
-            result.append(self._read_one_byte())
+            self._read_one_byte(steps)
+
+        self._write_nack(steps)
+
+    # =======================================================================
+    #
+    # replay of the steps
+    #
+    # =======================================================================
 
-        self._write_nack()
-        self._write_stop()
+    def _replay(self, steps: list) -> list:
+        """Replay the steps via the pins, return the samples.
+        """
+        samples = []
+        scl, sda = 1, 1
+        for s_scl, s_sda, sample in steps:
+            if s_scl != scl:
+                scl = s_scl
+                self._wait()
+                self._scl.write(scl)
+                if scl:
+                    self._wait_scl()
+            if s_sda != sda:
+                sda = s_sda
+                self._wait()
+                self._sda.write(sda)
+            if sample:
+                samples.append(self._sda.read())
+        return samples
+
+    def _run(self, steps: list) -> list:
+        """Replay the steps, return the samples.
+
+        Raises i2c_error when a slave stretches the clock too long.
+        Both lines are then released, because the next transaction
+        starts from an idle bus.
+        """
+        try:
+            if self._sequencer != None:
+                return self._sequencer.run(
+                    steps, self._half_bit_ns, self._stretch_timeout_ns)
+            return self._replay(steps)
+        except TimeoutError:
+            self._scl.write(1)
+            self._sda.write(1)
+            raise i2c_error(
+                "i2c slave holds SCL low for longer than the stretch timeout")
+
+    def recover(self) -> bool:
+        """Free the bus from a slave that is stuck in a transaction.
+
+        A slave that was interrupted in the middle of a transaction
+        (for instance by a reset of the master) can hold SDA low.
+        This clocks out 9 SCL pulses, which makes the slave finish
+        its byte, followed by a STOP.
+        Returns whether the bus is free (SDA is high) afterwards.
+        """
+        steps = [(1, 1, False)]
+        for i in range(0, 9):
+            steps.append((0, 1, False))
+            steps.append((1, 1, False))
+        self._write_stop(steps)
+        steps.append((1, 1, True))
+        return bool(self._run(steps)[-1])
+
+    def transaction(self, messages: list) -> list:
+        """An i2c transaction of several messages.
+
+        Each message is (address, list of bytes) for a write,
+        or (address, n) for a read of n bytes.
+        The messages are separated by repeated STARTs.
+        The list of the data read by the read messages is returned.
+        """
+        steps = []
+        self._write_start(steps)
+        first = 1
+        for address, data in messages:
+            if not first:
+                self._write_repeated_start(steps)
+            first = 0
+            if isinstance(data, int):
+                self._read_part(steps, address, data)
+            else:
+                self._write_part(steps, address, data)
+        self._write_stop(steps)
+
+        samples = self._run(steps)
+
+        # decode the samples: per message, the ack of the address,
+        # per written byte an ack, per read byte 8 bits
+        result = []
+        i = 0
+        for address, data in messages:
+            i += 1
+            if isinstance(data, int):
+                bytes_read = []
+                for n in range(0, data):
+                    byte = 0
+                    for bit in samples[i: i + 8]:
+                        byte = (byte << 1) | (1 if bit else 0)
+                    bytes_read.append(byte)
+                    i += 8
+                result.append(bytes_read)
+            else:
+                i += len(data)
         return result
 
-    def read_command(self, address: int, command: int, n: int) -> list:
-        """An i2c read transaction, with an 8 bit register address
+    def write(self, address: int, data: list):
+        """An i2c write transaction
 
-        Writes the command byte, then reads and returns the next n bytes from the i2c bus"""
-        self.write(address, [command])
-        return self.read(address, n)
+        Perform an i2c write transaction:
+        write the bytes to the chip with
+        the (7-bit) address.
+        """
+        self.transaction([(address, data)])
 
-    def write_command(self, address: int, command: int, data: list):
-        """An i2c write transaction, with an 8 bit register address
+    def read(self, address: int, n: int) -> list:
+        """An i2c read transaction.
 
-        Writes the command byte, then the data bytes to the i2c bus
+        Perform an i2c read transaction:
+        read and return n bytes from the chip with
+        the (7-bit) address.
         """
-        self.write(address, [command])
-        self.write(address, data)
\ No newline at end of file
+        return self.transaction([(address, n)])[0]
@@ -6,20 +6,60 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
+class i2c_error(Exception):
+    """An i2c bus error, like a slave that holds the clock low.
+    """
+    pass
+
 class i2c_interface:
     """
     I2C interface
-    Implementations should implement at least the methods defined here.
+    Implementations should implement at least the methods defined here
+    that raise NotImplementedError: transfer(), read_command() and
+    write_command() are implemented here, on top of transaction()
+    and write().
+
+    transfer() writes the write_bytes and then, after a repeated START
+    (without a STOP in between), reads and returns read_len bytes.
+    This is the customary way to read registers from a chip.
+
+    transaction() performs a list of messages, separated by repeated
+    STARTs: (address, list of bytes) for a write, (address, n) for
+    a read of n bytes. It returns the list of the data read.
     """
 
     def read_command(self, address: int, command: int, n: int) -> list:
-        raise NotImplementedError
+        """An i2c read transaction, with an 8 bit register address
+
+        Writes the command byte, then (after a repeated START)
+        reads and returns the next n bytes from the i2c bus"""
+        return self.transfer(address, [command], n)
 
     def write_command(self, address: int, command: int, data: list):
-        raise NotImplementedError
+        """An i2c write transaction, with an 8 bit register address
+
+        Writes the command byte, then the data bytes to the i2c bus,
+        in one transaction
+        """
+        self.write(address, [command] + list(data))
 
     def write(self, address: int, data: list):
         raise NotImplementedError
 
     def read(self, address: int, count: int) -> list:
+        raise NotImplementedError
+
+    def transfer(self, address: int, write_bytes: list, read_len: int) -> list:
+        """An i2c write-read transaction.
+
+        Perform an i2c transaction that writes the write_bytes to the chip
+        with the (7-bit) address, and then, after a repeated START,
+        reads and returns read_len bytes.
+        """
+        if read_len == 0:
+            self.transaction([(address, write_bytes)])
+            return []
+        return self.transaction([(address, write_bytes), (address, read_len)])[0]
+
+    def transaction(self, messages: list) -> list:
         raise NotImplementedError
\ No newline at end of file
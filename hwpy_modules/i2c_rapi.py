@@ -7,7 +7,23 @@ home: https://www.github.com/wovo/hwpy
 """
 
 from hwpy_modules.i2c_interface import *
-import smbus
+import ctypes, fcntl, os
+
+# i2c-dev ioctl interface (linux/i2c-dev.h, linux/i2c.h)
+_I2C_RDWR = 0x0707
+_I2C_M_RD = 0x0001
+
+class _i2c_msg(ctypes.Structure):
+    _fields_ = [
+        ('addr', ctypes.c_uint16),
+        ('flags', ctypes.c_uint16),
+        ('len', ctypes.c_uint16),
+        ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+class _i2c_rdwr_ioctl_data(ctypes.Structure):
+    _fields_ = [
+        ('msgs', ctypes.POINTER(_i2c_msg)),
+        ('nmsgs', ctypes.c_uint32)]
 
 class _rapi_i2c_hardware(i2c_interface):
     """Hardware i2c interface.
@@ -17,6 +33,10 @@ class _rapi_i2c_hardware(i2c_interface):
     but it must be enabled
     (sudo raspi-config; select 5 Interfacing Options; enable i2c),
     and it can only use the hardware i2c pins.
+
+    All transactions are passed to the kernel as one I2C_RDWR ioctl
+    on /dev/i2c-N, so there is no 32-byte (SMBus block) limit, and a
+    multi-message transaction costs one kernel call.
     """
 
     def __init__(self, interface: int = 1):
@@ -27,9 +47,8 @@ class _rapi_i2c_hardware(i2c_interface):
         'IOError: [Errno 2] No such file or directory'
         try with interface=0.
         """
-        import smbus
         try:
-           self._bus = smbus.SMBus(interface)
+           self._fd = os.open("/dev/i2c-%d" % interface, os.O_RDWR)
         except FileNotFoundError:
              print(
                 "To use the hardware i2c, enable i2c in the kernel using "
@@ -44,7 +63,7 @@ class _rapi_i2c_hardware(i2c_interface):
         Perform an i2c write transaction, writing the values
         in the data list to the device at the specified address.
         """
-        self._bus.write_i2c_block_data(address, data[0], data[1:])
+        self.transaction([(address, data)])
 
     def read(self, address: int, n: int) -> list:
         """An i2c read transaction.
@@ -52,13 +71,38 @@ class _rapi_i2c_hardware(i2c_interface):
         Perform an i2c read transaction, reading and returning
         n bytes from the device at the specified address.
         """
-        return self._bus.read_i2c_block_data(address, 0, n)
+        return self.transaction([(address, n)])[0]
+
+    def transaction(self, messages: list) -> list:
+        """Perform the messages as one i2c transaction.
 
-    def read_command(self, address: int, command: int, n: int) -> list:
-        return self._bus.read_i2c_block_data(address, command, n)
+        Each message is (address, list of bytes) for a write,
+        or (address, n) for a read of n bytes.
+        The messages are separated by repeated STARTs, and are
+        passed to the kernel in one I2C_RDWR ioctl
+        (the kernel accepts up to 42 messages of up to 8192 bytes).
+        The list of the data read by the read messages is returned.
+        """
+        msgs = (_i2c_msg * len(messages))()
+        buffers = []
+        for i, (address, data) in enumerate(messages):
+            if isinstance(data, int):
+                buffer = (ctypes.c_uint8 * data)()
+                msgs[i].flags = _I2C_M_RD
+            else:
+                buffer = (ctypes.c_uint8 * len(data))(*data)
+                msgs[i].flags = 0
+            msgs[i].addr = address
+            msgs[i].len = len(buffer)
+            msgs[i].buf = buffer
+            buffers.append(buffer)
+        request = _i2c_rdwr_ioctl_data(msgs, len(messages))
+        fcntl.ioctl(self._fd, _I2C_RDWR, request)
+        return [
+            list(buffer)
+            for (address, data), buffer in zip(messages, buffers)
+            if isinstance(data, int)]
 
-    def write_command(self, address: int, command: int, data: list):
-        self._bus.write_i2c_block_data(address, command, data)
 
 # ===========================================================================
 #
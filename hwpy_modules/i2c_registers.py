@@ -7,6 +7,7 @@ home: https://www.github.com/wovo/hwpy
 """
 
 from hwpy_modules.i2c_interface import *
+import hwpy_modules.decode as decode
 
 class i2c_registers:
     """Access to registers in an i2c peripheral chip.
@@ -16,37 +17,118 @@ class i2c_registers:
     the register address for subsequent written bytes (in the same
     transaction) or read bytes (in the next transaction).
     Word (2 byte) values are assumed to be high-byte-first.
+
+    Optionally the registers are cached in a shadow copy:
+    a register that was read or written once is then read from
+    the cache instead of from the chip, which is useful for
+    configuration registers, and for the read-modify-write of
+    bit fields (write_bits).
+    Registers that can change by themselves (data, status) must
+    be marked as volatile: those are always read from the chip.
     """
 
-    def __init__(self, i2c: i2c_interface, address: int):
+    def __init__(
+        self,
+        i2c: i2c_interface,
+        address: int,
+        cache: bool = False,
+        volatile: list = ()
+    ):
         """Create a register access object.
 
         A register access object is created from an i2c bus
         and the i2c address of the peripheral.
+        When cache is True, the non-volatile registers are cached.
         """
         self._i2c = i2c
         self._address = address
+        self._cache = {} if cache else None
+        self._volatile = set(volatile)
+
+    def set_volatile(self, register: int, volatile: bool = True):
+        """Mark a register as volatile (or not).
+        """
+        if volatile:
+            self._volatile.add(register)
+            self.invalidate(register)
+        else:
+            self._volatile.discard(register)
+
+    def invalidate(self, register: int = None):
+        """Forget the cached value of the register (default: all).
+
+        This is needed when a register changes by itself,
+        for instance after a reset of the chip.
+        """
+        if self._cache != None:
+            if register == None:
+                self._cache.clear()
+            else:
+                self._cache.pop(register, None)
+
+    def _cached(self, register: int, n: int) -> list:
+        if self._cache == None:
+            return None
+        result = []
+        for r in range(register, register + n):
+            if r in self._volatile or not r in self._cache:
+                return None
+            result.append(self._cache[r])
+        return result
+
+    def _store(self, register: int, data: list):
+        if self._cache != None:
+            for r, value in enumerate(data, register):
+                if not r in self._volatile:
+                    self._cache[r] = value
+
+    def write_block(self, register: int, data: list):
+        """Write the bytes to the registers, starting at the register.
+
+        This is one i2c transaction: the chip must increment
+        the register address after each byte.
+        """
+        data = list(data)
+        self._i2c.write_command(self._address, register, data)
+        self._store(register, data)
+
+    def read_block(self, register: int, n: int) -> list:
+        """Read and return n bytes from the registers, starting at the register.
+
+        This is one i2c transaction (unless all registers are cached):
+        the chip must increment the register address after each byte.
+        """
+        result = self._cached(register, n)
+        if result == None:
+            result = self._i2c.read_command(self._address, register, n)
+            self._store(register, result)
+        return result
+
+    def write_bits(self, register: int, mask: int, value: int):
+        """Write the value to the bits of the register in the mask.
+
+        The other bits of the register are unchanged.
+        With a cache, this only reads the chip the first time.
+        """
+        old = self.read_byte(register)
+        self.write_byte(register, (old & ~ mask) | (value & mask))
 
     def write_byte(self, register: int, value: int):
         """Write the specified byte to the specified register.
         """
-        self._i2c.write_command(self._address, register, [value])
+        self.write_block(register, [value])
 
     def write_word(self, register: int, value: int):
         """Write the specified word (2 bytes) to the specified register.
         """
-        self._i2c.write_command(self._address, register, [value >> 8, value & 0xFF])
-        # self._i2c.write(self._address, [register, value >> 8, value & 0xFF])
+        self.write_block(register, [value >> 8, value & 0xFF])
 
     def read_byte(self, register: int) -> int:
         """Read and return a byte from the specified register.
         """
-        return self._i2c.read_command(self._address, register, 1)[0]
+        return self.read_block(register, 1)[0]
 
     def read_word(self, register: int) -> int:
         """Read and return a word (2 bytes) from the specified register.
         """
-        result = self._i2c.read_command(self._address, register, 2)
-        return (result[0] << 8) + result[1]
-
-
+        return decode.unsigned(self.read_block(register, 2))
@@ -0,0 +1,143 @@
+"""
+i2c bus scheduler
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+import threading, contextlib, heapq, time
+
+from hwpy_modules.i2c_interface import *
+
+class i2c_scheduler(i2c_interface):
+    """Thread-safe access to an i2c bus.
+
+    An i2c_scheduler wraps an i2c interface (any implementation),
+    and serializes its use by several threads: each read, write,
+    transfer or transaction is done as a whole, so the bytes of
+    transactions from different threads are never interleaved.
+
+    When the bus is busy, the waiting threads get the bus in the
+    order of their priority (highest first), and within the same
+    priority in order of arrival.
+    The priority of a transaction is that of its (first) device,
+    which is set by priority(), the default is 0.
+
+    To do several transactions without other threads in between
+    (like a read-modify-write of a register), use
+       with bus.exclusive( address ):
+          ...
+    The exclusive use can be nested, and the transactions within
+    the block don't wait.
+
+    The scheduler keeps some statistics:
+       - transactions: the number of transactions
+       - queue_depth: the number of threads waiting now
+       - max_queue_depth: the maximum number of waiting threads
+       - wait_time: the total time (seconds) spent waiting for the bus
+       - max_wait_time: the longest wait
+    """
+
+    def __init__(self, i2c: i2c_interface, priorities: dict = None):
+        """Create a scheduler for an i2c bus.
+
+        The priorities, if specified, is a dictionary that maps
+        device addresses to their priorities.
+        """
+        self._i2c = i2c
+        self._priorities = {} if priorities == None else dict(priorities)
+        self._condition = threading.Condition()
+        self._owner = None
+        self._depth = 0
+        self._waiting = []
+        self._arrivals = 0
+        self.reset_statistics()
+
+    def priority(self, address: int, priority: int):
+        """Set the priority of the device with the (7-bit) address.
+        """
+        self._priorities[address] = priority
+
+    def reset_statistics(self):
+        """Reset the statistics (except queue_depth) to 0.
+        """
+        self.transactions = 0
+        self.max_queue_depth = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    def _acquire(self, priority: int):
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+                return
+
+            start = time.perf_counter()
+            self._arrivals += 1
+            ticket = (-priority, self._arrivals, me)
+            heapq.heappush(self._waiting, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            while self._owner != None or self._waiting[0] != ticket:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._owner = me
+            self._depth = 1
+
+            waited = time.perf_counter() - start
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def _release(self):
+        with self._condition:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self, address: int = None, priority: int = None):
+        """Context manager for the exclusive use of the bus.
+
+        The bus is claimed with the priority, by default the
+        priority of the device with the address.
+        """
+        if priority == None:
+            priority = self._priorities.get(address, 0)
+        self._acquire(priority)
+        try:
+            yield self
+        finally:
+            self._release()
+
+    def _scheduled(self, address: int, function, *args):
+        with self.exclusive(address):
+            self.transactions += 1
+            return function(*args)
+
+    def read_command(self, address: int, command: int, n: int) -> list:
+        return self._scheduled(
+            address, self._i2c.read_command, address, command, n)
+
+    def write_command(self, address: int, command: int, data: list):
+        self._scheduled(
+            address, self._i2c.write_command, address, command, data)
+
+    def write(self, address: int, data: list):
+        self._scheduled(address, self._i2c.write, address, data)
+
+    def read(self, address: int, count: int) -> list:
+        return self._scheduled(address, self._i2c.read, address, count)
+
+    def transfer(self, address: int, write_bytes: list, read_len: int) -> list:
+        return self._scheduled(
+            address, self._i2c.transfer, address, write_bytes, read_len)
+
+    def transaction(self, messages: list) -> list:
+        return self._scheduled(
+            messages[0][0], self._i2c.transaction, messages)
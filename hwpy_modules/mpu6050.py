@@ -6,11 +6,186 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
-from hwpy_extern.bitstring.bitstring import Bits
+import sys, time, threading, queue, array
+
+import hwpy_modules.decode as decode
 from hwpy_modules.xy import *
 from hwpy_modules.i2c_interface import *
 from hwpy_modules.i2c_registers import *
 
+class mpu6050_sample:
+    """The readings of an mpu6050 at one moment.
+
+    acceleration (xyz, in g), temperature (degrees Celcius)
+    and gyroscopes (xyz, in degrees per second).
+    """
+
+    def __init__(self, acceleration: xyz, temperature: float, gyroscopes: xyz):
+        self.acceleration = acceleration
+        self.temperature = temperature
+        self.gyroscopes = gyroscopes
+
+class mpu6050_batch:
+    """A batch of samples from the FIFO of an mpu6050.
+
+    data holds the raw readings, per sample 6 values: the x, y and z
+    acceleration and the x, y and z gyroscopes, as array('h') of
+    6 * n values, or (with numpy) as an n x 6 int16 array.
+    The acceleration is in units of 1/16384 g, the gyroscopes in
+    units of 1/131 degrees per second.
+
+    timestamp is the (time.time()) time of the first sample,
+    interval is the time between samples (both in seconds).
+    overflow is True when samples were lost before this batch,
+    because the FIFO of the chip was not emptied in time.
+    """
+
+    def __init__(self, data, timestamp: float, interval: float, overflow: bool):
+        self.data = data
+        self.timestamp = timestamp
+        self.interval = interval
+        self.overflow = overflow
+
+    def __len__(self):
+        """Return the number of samples.
+        """
+        if isinstance(self.data, array.array):
+            return len(self.data) // 6
+        return len(self.data)
+
+class mpu6050_stream:
+    """A stream of batches of samples from the FIFO of an mpu6050.
+
+    A stream is created by mpu6050.stream().
+    A background thread empties the FIFO of the chip (in bulk reads)
+    and collects the samples into batches of batch_size samples,
+    which are returned by iterating over the stream:
+       for batch in chip.stream( 1000, 100 ):
+          ...
+    The iteration ends when the stream is stopped.
+    When the background thread fails (like an i2c error), the stream
+    stops, and the iteration raises the exception (also stored in error).
+    overflows is the number of FIFO overflows so far.
+
+    While the stream runs, the background thread uses the i2c bus.
+    When other threads use the same bus, use an i2c_scheduler.
+    """
+
+    _sample_size = 12
+
+    def __init__(self, chip: 'mpu6050', rate: int, batch_size: int, numpy: bool):
+        self._chip = chip
+        self._registers = chip.registers
+        self._interval = 1.0 / rate
+        self._batch_size = batch_size
+        self._numpy = numpy
+        if numpy:
+            # check here, not in the background thread
+            decode.block(b'', numpy = True)
+        self._batches = queue.Queue()
+        self._running = True
+        self.overflows = 0
+        self.error = None
+
+        # sample rate = 1 kHz (DLPF 184 Hz) / ( 1 + divider )
+        self._registers.write_byte(chip.CONFIG, 0x01)
+        self._registers.write_byte(
+            chip.SMPLRT_DIV, max(0, min(255, round(1000 / rate) - 1)))
+        self._registers.write_byte(chip.INT_ENABLE, 0x00)
+
+        # FIFO: accelerometer and gyroscopes
+        self._registers.write_byte(chip.USER_CTRL, 0x00)
+        self._registers.write_byte(chip.FIFO_EN, 0x78)
+        self._reset_fifo()
+
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def _reset_fifo(self):
+        self._registers.write_byte(self._chip.USER_CTRL, 0x04)
+        self._registers.write_byte(self._chip.USER_CTRL, 0x40)
+        self._registers.read_byte(self._chip.INT_STATUS)
+
+    def _batch(self, data: bytes, timestamp: float, overflow: bool):
+        if self._numpy:
+            values = decode.block(data, numpy = True).reshape(-1, 6)
+        else:
+            values = array.array('h', data)
+            if sys.byteorder == 'little':
+                values.byteswap()
+        self._batches.put(
+            mpu6050_batch(values, timestamp, self._interval, overflow))
+
+    def _run(self):
+        """The background thread: empty the FIFO, collect batches.
+        """
+        try:
+            pending = bytearray()
+            timestamp = None
+            overflow = False
+            batch_bytes = self._batch_size * self._sample_size
+            poll = min(self._batch_size, 20) * self._interval
+            while self._running:
+                time.sleep(poll)
+
+                if self._registers.read_byte(self._chip.INT_STATUS) & 0x10:
+                    # FIFO overflow: its contents are no longer aligned
+                    self.overflows += 1
+                    self._reset_fifo()
+                    pending.clear()
+                    timestamp = None
+                    overflow = True
+                    continue
+
+                count = self._registers.read_word(self._chip.FIFO_COUNTH)
+                count -= count % self._sample_size
+                if count == 0:
+                    continue
+                now = time.time()
+                data = self._registers.read_block(self._chip.FIFO_R_W, count)
+
+                # the last sample was taken (at most one interval) before now
+                if timestamp == None:
+                    timestamp = now - (
+                        count // self._sample_size - 1) * self._interval
+                pending += bytes(data)
+
+                while len(pending) >= batch_bytes:
+                    self._batch(
+                        bytes(pending[ : batch_bytes]), timestamp, overflow)
+                    del pending[ : batch_bytes]
+                    timestamp += self._batch_size * self._interval
+                    overflow = False
+
+            self._registers.write_byte(self._chip.FIFO_EN, 0x00)
+            self._registers.write_byte(self._chip.USER_CTRL, 0x00)
+        except Exception as e:
+            # a bus error: it is raised by the iteration
+            self.error = e
+        finally:
+            self._batches.put(None)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> mpu6050_batch:
+        batch = self._batches.get()
+        if batch == None:
+            self._batches.put(None)
+            if self.error != None:
+                raise self.error
+            raise StopIteration
+        return batch
+
+    def stop(self):
+        """Stop the stream, and disable the FIFO of the chip.
+
+        The batches that are already collected can still be read.
+        """
+        self._running = False
+        if self._thread != threading.current_thread():
+            self._thread.join()
+
 class mpu6050:
     """A simple interface to the mpu6050 accelerometer.
     """
@@ -27,6 +202,14 @@ class mpu6050:
     GYRO_ZOUT0 = 0x47
     ACCEL_CONFIG = 0x1C
     GYRO_CONFIG = 0x1B
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    FIFO_EN = 0x23
+    INT_ENABLE = 0x38
+    INT_STATUS = 0x3A
+    USER_CTRL = 0x6A
+    FIFO_COUNTH = 0x72
+    FIFO_R_W = 0x74
 
     def __init__(self, i2c: i2c_interface, address=0x68):
         """Create an mpu6050 interface from an i2c bus and the chip address.
@@ -37,22 +220,50 @@ class mpu6050:
     def temperature(self) -> float:
         """Read and return the temperature, in degrees Celcius.
         """
-        raw_temp = Bits(uint=self.registers.read_word(self.TEMP_OUT0), length=16).int
+        raw_temp = decode.signed(self.registers.read_block(self.TEMP_OUT0, 2))
         actual_temp = (raw_temp / 340.0) + 36.53
         return actual_temp
 
     def gyroscopes(self) -> xyz:
         """Read and return the gyroscope readings.
         """
-        return xyz(
-            Bits(uint=self.registers.read_word(self.GYRO_XOUT0), length=16).int / 131,
-            Bits(uint=self.registers.read_word(self.GYRO_YOUT0), length=16).int / 131,
-            Bits(uint=self.registers.read_word(self.GYRO_ZOUT0), length=16).int / 131 )
+        x, y, z = decode.block(self.registers.read_block(self.GYRO_XOUT0, 6))
+        return xyz(x / 131, y / 131, z / 131)
 
     def acceleration(self) -> xyz:
         """Read and return the acceleration readings.
         """
-        return xyz(
-            Bits(uint=self.registers.read_word(self.ACCEL_XOUT0), length=16).int / 16384.0,
-            Bits(uint=self.registers.read_word(self.ACCEL_YOUT0), length=16).int / 16384.0,
-            Bits(uint=self.registers.read_word(self.ACCEL_ZOUT0), length=16).int / 16384.0)
\ No newline at end of file
+        x, y, z = decode.block(self.registers.read_block(self.ACCEL_XOUT0, 6))
+        return xyz(x / 16384.0, y / 16384.0, z / 16384.0)
+
+    def sample(self) -> mpu6050_sample:
+        """Read and return the acceleration, temperature and gyroscopes.
+
+        The 14 registers from ACCEL_XOUT0 up to and including GYRO_ZOUT1
+        are read in one i2c transaction, so the readings are of the
+        same moment, and this is much faster than reading them one by one.
+        """
+        ax, ay, az, t, gx, gy, gz = decode.block(
+            self.registers.read_block(self.ACCEL_XOUT0, 14))
+        return mpu6050_sample(
+            xyz(ax / 16384.0, ay / 16384.0, az / 16384.0),
+            (t / 340.0) + 36.53,
+            xyz(gx / 131, gy / 131, gz / 131))
+
+    def stream(
+        self,
+        rate: int = 1000,
+        batch_size: int = 100,
+        numpy: bool = False
+    ) -> mpu6050_stream:
+        """Start streaming acceleration and gyroscope samples.
+
+        The chip takes the samples at the rate (4..1000 Hz) into
+        its FIFO, so the sample timing doesn't depend on Python.
+        A background thread empties the FIFO in bulk.
+        The samples are returned in batches of batch_size samples,
+        see mpu6050_stream and mpu6050_batch.
+        The data of a batch is an array('h'), or a numpy array
+        when numpy is True.
+        """
+        return mpu6050_stream(self, rate, batch_size, numpy)
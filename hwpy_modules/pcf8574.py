@@ -9,7 +9,7 @@ home: https://www.github.com/wovo/hwpy
 from hwpy_modules.i2c_interface import *
 from hwpy_modules.gpio_buffered import *
 
-class _pcf8574x:
+class _pcf8574x(buffered_master):
     """Interface to pcf8754(a) i2c I/O extenders.
 
     The pcf8574 and pcf8574a are 8-bit i2c I/O extenders.
@@ -21,27 +21,82 @@ class _pcf8574x:
        - as a port: chip.write( 0x55 )
        - as a single pin within the port: chip.pins[ 2 ].write( 0 )
        - as a single named pin: chip.p2.write( 0 )
+
+    Writes to several pins can be combined into one i2c transaction:
+       with chip.batch():
+          chip.p0.write( 1 )
+          chip.p2.write( 0 )
+
+    The open-drain INT output of the chip can be connected to
+    a gpi pin (with pull-up). The chip is then only read when INT
+    signals a change of its inputs (or after a write to the chip),
+    otherwise the last value read from the chip is used.
+    When the gpi supports edge callbacks (Raspberry Pi), idle reads
+    don't even read the INT pin.
     """
 
-    def __init__(self, i2c: i2c_interface, address: int):
+    def __init__(self, i2c: i2c_interface, address: int, interrupt: 'gpi' = None):
         """A pcf8574(a) interface from an i2c port and the slave address.
 
         Note: the address is the 7-bit i2c address.
+        The optional interrupt is the gpi connected to INT.
         """
+        buffered_master.__init__(self)
         self._i2c = i2c
         self._address = address
+        self._interrupt = interrupt
+        self._interrupt_edges = False
+        self._interrupt_flag = False
+        if self._interrupt != None:
+            try:
+                self._interrupt.on_falling_edge(self._on_interrupt)
+                self._interrupt_edges = True
+            except AttributeError:
+                pass
         self.pins = []
-        self._read_buffer = 0
-        self._write_buffer = 0
         self.n = 8
         for i in range(0, 8):
             self.pins.append(buffered_pin(self, i))
         self.p0, self.p1, self.p2, self.p3, self.p4, self.p5, self.p6, self.p7 = self.pins
 
+    def _on_interrupt(self):
+        """Called on a falling edge of INT.
+        """
+        self._interrupt_flag = True
+
+    def _interrupted(self) -> bool:
+        """Return whether INT signals a change since the last read.
+        """
+        if self._interrupt_edges:
+            # clear the flag only when it was seen set (and before
+            # the chip is read): an edge that arrives in between
+            # sets it again, instead of being lost
+            if self._interrupt_flag:
+                self._interrupt_flag = False
+                return True
+            return False
+        return not self._interrupt.read()
+
+    def _reading(self):
+        """The read_buffer is needed.
+
+        With an INT pin, the chip is read only when INT signals
+        a change, or when nothing was read since the last write.
+        Otherwise the refresh policy of the buffered master applies.
+        """
+        if self._interrupt == None:
+            buffered_master._reading(self)
+            return
+        self.flush()
+        if self._interrupted() or self._refreshed_ns == None:
+            self.refresh()
+
     def _flush(self):
         """Flush (write) the _write_buffer to the chip.
         """
         self._i2c.write(self._address, [self._write_buffer])
+        if self._interrupt != None:
+            self._refreshed_ns = None
 
     def _refresh(self):
         """Refresh (read) the _read_buffer from the chip.
@@ -52,28 +107,44 @@ class _pcf8574x:
         """Write the value to the chips pins.
         """
         self._write_buffer = value
-        self._flush()
+        self._written()
+
+    def write_sequence(self, values: list):
+        """Write the values to the chips pins, one after the other.
+
+        The values are written in one i2c transaction:
+        the chip outputs each byte in turn, so this can be used to
+        generate a sequence of pin states (like a strobe pulse)
+        much faster than by separate writes.
+        """
+        self.flush()
+        self._i2c.write(self._address, list(values))
+        self._write_buffer = values[-1]
+        if self._interrupt != None or self.refresh_us != None:
+            self._refreshed_ns = None
 
     def read(self) -> int:
         """Read and return the chip pins.
         """
-        self._refresh()
+        self._reading()
         return self._read_buffer
 
 
-def pcf8574(i2c: i2c_interface, address: int = 0) -> _pcf8574x:
+def pcf8574(i2c: i2c_interface, address: int = 0, interrupt: 'gpi' = None) -> _pcf8574x:
     """pcf8574 I/O extender interface
 
     Create a pcf8574 interface from the i2c port and the
-    (3-bit) address configured on the 3 address pins a0-a1-a2.
+    (3-bit) address configured on the 3 address pins a0-a1-a2,
+    and optionally the gpi connected to the INT pin.
     """
-    return _pcf8574x(i2c, 0x20 + address)
+    return _pcf8574x(i2c, 0x20 + address, interrupt)
 
 
-def pcf8574a(i2c: i2c_interface, address: int = 0) -> _pcf8574x:
+def pcf8574a(i2c: i2c_interface, address: int = 0, interrupt: 'gpi' = None) -> _pcf8574x:
     """pcf8574a I/O extender interface
 
     Create a pcf8574a interface from the i2c port and the
-    (3-bit) address configured on the 3 address pins a0-a1-a2.
+    (3-bit) address configured on the 3 address pins a0-a1-a2,
+    and optionally the gpi connected to the INT pin.
     """
-    return _pcf8574x(i2c, 0x38 + address)
\ No newline at end of file
+    return _pcf8574x(i2c, 0x38 + address, interrupt)
\ No newline at end of file
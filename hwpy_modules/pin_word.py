@@ -0,0 +1,52 @@
+"""
+mapping of port values to words of gpio pins
+
+part of hwpy: an OO hardware interface library
+
+home: https://www.github.com/wovo/hwpy
+"""
+
+class _pin_word:
+    """The mapping of the bits of a port value to a word of pins.
+
+    A gpio backend that reads or writes a set of its pins in one
+    operation does so with a word that has a bit per pin number
+    (a register, or a server command).
+    Bit 0 of a port value corresponds to the first pin, etc.
+    """
+
+    def __init__( self, pins: list ):
+        """Create the mapping for the list of pin numbers.
+        """
+        self.pins = pins[ : ]
+        self.mask = 0
+        for pin in self.pins:
+            self.mask |= 1 << pin
+
+        # common case: consecutive pins, value is just shifted
+        first = self.pins[ 0 ]
+        self._shift = first
+        if self.pins != list( range( first, first + len( self.pins ) ) ):
+            self._shift = None
+
+    def word( self, v: int ) -> int:
+        """Return the word for the port value v.
+        """
+        if self._shift != None:
+            return ( v << self._shift ) & self.mask
+        word = 0
+        for i, pin in enumerate( self.pins ):
+            if v & ( 1 << i ):
+                word |= 1 << pin
+        return word
+
+    def value( self, word: int ) -> int:
+        """Return the port value for the word.
+        """
+        if self._shift != None:
+            return ( word & self.mask ) >> self._shift
+        result = 0
+        for i, pin in enumerate( self.pins ):
+            if word & ( 1 << pin ):
+                result |= 1 << i
+        return result
@@ -6,11 +6,162 @@ part of hwpy: an OO hardware interface library
 home: https://www.github.com/wovo/hwpy
 """
 
+from hwpy_modules.gpio import *
+from hwpy_modules.gpio_buffered import *
+from hwpy_modules.invert import *
+
+class _pin_step:
+   """Port plan step: read or write a single pin.
+   """
+
+   def __init__( self, pin, port_mask: int ):
+      self._pin = pin
+      self._port_mask = port_mask
+
+   def write( self, v: int ):
+      self._pin.write( ( v & self._port_mask ) != 0 )
+
+   def read( self ) -> int:
+      return self._port_mask if self._pin.read() else 0
+
+class _master_step:
+   """Port plan step: read or write the pins of one buffered master.
+
+   The bits for all pins are put in the write_buffer of the master,
+   which is then written once, or the master is refreshed once
+   and the bits for all pins are taken from its read_buffer.
+   """
+
+   def __init__( self, master ):
+      self._master = master
+      self._bits = []
+
+   def add( self, port_mask: int, pin_mask: int, inverted: bool ):
+      self._bits.append( ( port_mask, pin_mask, inverted ) )
+
+   def write( self, v: int ):
+      buffer = self._master._write_buffer
+      for port_mask, pin_mask, inverted in self._bits:
+         if ( ( v & port_mask ) != 0 ) != inverted:
+            buffer |= pin_mask
+         else:
+            buffer &= ~ pin_mask
+      self._master._write_buffer = buffer
+      self._master._written()
+
+   def read( self ) -> int:
+      self._master._reading()
+      buffer = self._master._read_buffer
+      result = 0
+      for port_mask, pin_mask, inverted in self._bits:
+         if ( ( buffer & pin_mask ) != 0 ) != inverted:
+            result |= port_mask
+      return result
+
+class _backend_step:
+   """Port plan step: read or write pins of one gpio backend.
+
+   A gpio backend can provide a port object that reads or writes
+   a set of its gpio pins in one operation (gpio._port):
+   a remote port command, a register access, or a list call.
+   """
+
+   def __init__( self, gpio ):
+      self._gpios = [ gpio ]
+      self._bits = []
+
+   def accepts( self, gpio ) -> bool:
+      return self._gpios[ 0 ]._port( self._gpios + [ gpio ] ) != None
+
+   def add( self, gpio, port_mask: int, inverted: bool ):
+      if self._bits:
+         self._gpios.append( gpio )
+      self._bits.append( ( port_mask, inverted ) )
+
+   def finish( self ):
+      self._port = self._gpios[ 0 ]._port( self._gpios )
+
+      # common case: the port value can be passed unchanged
+      self._direct = ( self._bits ==
+         [ ( 1 << i, False ) for i in range( 0, len( self._bits ) ) ] )
+
+   def write( self, v: int ):
+      if not self._direct:
+         w = 0
+         for i, ( port_mask, inverted ) in enumerate( self._bits ):
+            if ( ( v & port_mask ) != 0 ) != inverted:
+               w |= 1 << i
+         v = w
+      self._port.write( v )
+
+   def read( self ) -> int:
+      w = self._port.read()
+      if self._direct:
+         return w
+      result = 0
+      for i, ( port_mask, inverted ) in enumerate( self._bits ):
+         if ( ( w & ( 1 << i ) ) != 0 ) != inverted:
+            result |= port_mask
+      return result
+
+def _plan( pins, kinds ) -> list:
+   """Return the plan (list of steps) to read or write the pins.
+
+   Invert decorators of single pins are unwrapped, and so are
+   gpio pins of the kinds (gpi, gpo, gpoc).
+   The resulting pins are grouped per device:
+      - buffered pins are grouped per master
+      - backend gpio pins are grouped per backend port
+      - any other pin is read or written on its own
+   """
+   steps = []
+   masters = {}
+   backends = []
+   for i, pin in enumerate( pins ):
+      port_mask = 1 << i
+
+      device, inverted = pin, False
+      while isinstance( device, invert ) and not device._is_port:
+         device, inverted = device._minion, not inverted
+      if isinstance( device, kinds ):
+         device = device._pin
+
+      if isinstance( device, buffered_pin ):
+         step = masters.get( id( device._master ) )
+         if step == None:
+            step = _master_step( device._master )
+            masters[ id( device._master ) ] = step
+            steps.append( step )
+         step.add( port_mask, device._mask, inverted )
+
+      elif hasattr( device, '_port' ) and not isinstance( device, ( gpi, gpo, gpoc ) ):
+         for step in backends:
+            if step.accepts( device ):
+               break
+         else:
+            step = _backend_step( device )
+            backends.append( step )
+            steps.append( step )
+         step.add( device, port_mask, inverted )
+
+      else:
+         steps.append( _pin_step( pin, port_mask ) )
+
+   for step in backends:
+      step.finish()
+   return steps
+
 class port:
    """A port is a set of pins.
    
    port.n is the number of pins.
    port.pins are the pins themselves.
+
+   When a port is created, a plan is made to read and write its
+   pins per device: the pins that are provided by the same gpio
+   backend are read and written by that backend in one operation,
+   the (buffered) pins of the same chip with one flush or refresh.
+   Any other pins are read and written one by one.
    """
    
    def __init__( self, pins ):
@@ -18,6 +169,8 @@ class port:
       """
       self.pins = pins[ : ]
       self.n = len( self.pins )
+      self._read_plan = _plan( self.pins, ( gpi, gpoc ) )
+      self._write_plan = _plan( self.pins, ( gpo, ) )
 
    def read( self ):
       """Read from a port.
@@ -28,11 +181,8 @@ class port:
       The pins must support read().
       """      
       result = 0
-      mask = 1
-      for pin in self.pins:
-         if pin.read():
-            result = result + mask
-         mask = mask << 1
+      for step in self._read_plan:
+         result |= step.read()
       return result      
       
    def write( self, v ):
@@ -43,11 +193,9 @@ class port:
          the lowest-but-one is written to the second pin, etc.
       The pins must support write().
       """      
-      mask = 1
-      for pin in self.pins:
-         pin.write( ( v & mask ) != 0 )
-         mask = mask << 1
-         
+      for step in self._write_plan:
+         step.write( v )
+
    def make_input( self ):
       """Make all pins inputs. 
       
@@ -20,9 +20,37 @@ def wait_ms(n):
     wait_s(n / 1000.0)
 
 
+# how much longer than requested a short time.sleep() can take,
+# measured on the first call of wait_us()
+_sleep_overshoot_ns = None
+
+def _calibrate():
+    """Measure the overshoot of a short time.sleep().
+    """
+    global _sleep_overshoot_ns
+    overshoot = 0
+    for i in range(0, 5):
+        start = time.perf_counter_ns()
+        time.sleep(0.0001)
+        overshoot = max(overshoot, time.perf_counter_ns() - start - 100_000)
+    _sleep_overshoot_ns = 2 * overshoot + 50_000
+
+
 def wait_us(n):
     """Wait for n microseconds.
+
+    A time.sleep() can take much longer than requested
+    (on Linux typically 50..100 us more), so for short delays
+    this is a busy-wait on time.perf_counter_ns().
+    For a longer delay it sleeps for the most part,
+    and busy-waits only for the (calibrated) remainder.
     """
-    wait_ms(n / 1000.0)
+    deadline = time.perf_counter_ns() + int(n * 1000)
+    if _sleep_overshoot_ns == None:
+        _calibrate()
+    if n * 1000 > _sleep_overshoot_ns:
+        time.sleep((n * 1000 - _sleep_overshoot_ns) / 1_000_000_000)
+    while time.perf_counter_ns() < deadline:
+        pass
 
 
@@ -9,7 +9,10 @@ enum class command {
    output  = 1, 
    high    = 2, 
    low     = 3, 
-   read    = 4 
+   read    = 4,
+   read_port  = 5,
+   write_port = 6,
+   hello      = 7
 };   
 
 void do_command( hwlib::pin_in_out & pin, command cmd ){
@@ -35,4 +38,79 @@ void do_command( hwlib::pin_in_out & pin, command cmd ){
      hwlib::cout << ( pin.read() ? '1' : '0' );
 	  
    }	  	
-}
\ No newline at end of file
+}
+
+// ==========================================================================
+//
+// server commands: commands that don't address a single pin
+//
+// port commands read or write a set of pins in one exchange.
+// The command byte is followed by a 32-bit pin mask,
+// and for write_port by a 32-bit value, both low byte first.
+// read_port responds with the 32-bit value of the masked pins,
+// low byte first.
+//
+// hello responds with "hwpy", so the host can check that the
+// server is up and running without waiting for a reset.
+//
+// ==========================================================================
+
+uint_fast32_t get_word(){
+   uint_fast32_t word = 0;
+   for( int i = 0; i < 32; i += 8 ){
+      word |= ( (uint_fast32_t) (uint8_t) hwlib::cin.getc() ) << i;
+   }
+   return word;
+}
+
+void put_word( uint_fast32_t word ){
+   for( int i = 0; i < 32; i += 8 ){
+      hwlib::cout << (char) (( word >> i ) & 0xFF );
+   }
+}
+
+bool is_server_command( command cmd ){
+   return 
+      ( cmd == command::read_port ) 
+      || ( cmd == command::write_port )
+      || ( cmd == command::hello );
+}
+
+void do_server_command( 
+   hwlib::pin_in_out * pin_table[], 
+   int n_pins, 
+   command cmd 
+){
+   if( cmd == command::hello ){
+      hwlib::cout << "hwpy";
+      return;
+   }
+
+   uint_fast32_t mask = get_word();
+
+   if( cmd == command::read_port ){
+      uint_fast32_t word = 0;
+      for( int i = 0; i < n_pins; ++i ){
+         if( mask & ( 1UL << i ) ){
+            pin_table[ i ]->refresh();
+            if( pin_table[ i ]->read() ){
+               word |= ( 1UL << i );
+            }
+         }
+      }
+      put_word( word );
+
+   } else if( cmd == command::write_port ){
+      uint_fast32_t word = get_word();
+      for( int i = 0; i < n_pins; ++i ){
+         if( mask & ( 1UL << i ) ){
+            pin_table[ i ]->write( ( word & ( 1UL << i ) ) != 0 );
+         }
+      }
+      for( int i = 0; i < n_pins; ++i ){
+         if( mask & ( 1UL << i ) ){
+            pin_table[ i ]->flush();
+         }
+      }
+   }
+}
@@ -32,10 +32,14 @@ int main(){
 
    for(;;){	   
       char c = hwlib::cin.getc();	  
+      command cmd = (command) (( c >> 5 ) & 0x7 );
+      if( is_server_command( cmd ) ){
+         do_server_command( pin_table, 12, cmd );
+         continue;
+      }
       int pin_nr = c & 0x1F;
       if( pin_nr > 11 ) continue;
       auto & pin = * pin_table[ pin_nr ];
-      command cmd = (command) (( c >> 5 ) & 0x7 );
       //hwlib::cout << "p=" << pin_nr << " c=" << int(cmd) << "\n";
       do_command( pin, cmd );
    }   